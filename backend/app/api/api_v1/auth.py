@@ -1,15 +1,19 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
 from datetime import timedelta
-from typing import Any
+from typing import Any, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-import requests
-from requests.exceptions import RequestException
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, raiseload
+from jose import JWTError
 
 from app.core import security
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_async_db, get_db
 from app.models.user import User
 from app.schemas.token import Token
 from app.schemas.user import UserCreate, UserResponse
@@ -17,53 +21,104 @@ from app.schemas.user import UserCreate, UserResponse
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Verified tokens -> (user_id, expires_at), so repeat requests skip jwt.decode
+# and the username lookup. Entries live at most TOKEN_CACHE_TTL seconds.
+TOKEN_CACHE_MAX_SIZE = 4096
+TOKEN_CACHE_TTL = 60
+_token_cache: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+# Request auth only needs User columns; make any lazy relationship load fail
+# loudly instead of issuing a hidden per-request SELECT.
+USER_LOAD_OPTIONS = (raiseload("*"),)
+
+# Primary key of the guest user, resolved on first no-auth request
+_guest_user_id: Optional[int] = None
+
+
+def _get_cached_user_id(token: str) -> Optional[int]:
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at <= time.time():
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return user_id
+
+
+def _cache_user_id(token: str, user_id: int, exp: Optional[float]) -> None:
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if exp is not None:
+        expires_at = min(expires_at, float(exp))
+    with _token_cache_lock:
+        _token_cache[token] = (user_id, expires_at)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+            _token_cache.popitem(last=False)
+
+
+def _invalidate_token(token: str) -> None:
+    with _token_cache_lock:
+        _token_cache.pop(token, None)
+
+
 def get_current_user(
     db: Session = Depends(get_db),
     token: str = Depends(oauth2_scheme)
 ) -> User:
     # If no token provided, return guest user for development (no-auth mode)
     if not token:
-        guest_user = db.query(User).filter(User.username == "guest").first()
-        if not guest_user:
-            # Guest user should have been created on startup
-            # If not found, create it now with pre-hashed password
-            guest_user = User(
-                email="guest@fortes.local",
-                username="guest",
-                hashed_password="$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYzxHGvz6YC",  # Pre-hashed "guest"
-                is_active=True
-            )
-            db.add(guest_user)
-            db.commit()
-            db.refresh(guest_user)
-        return guest_user
-    
+        return get_guest_user(db)
+
+    cached_user_id = _get_cached_user_id(token)
+    if cached_user_id is not None:
+        user = db.get(User, cached_user_id, options=USER_LOAD_OPTIONS)
+        if user is not None:
+            return user
+        _invalidate_token(token)
+
     # Try to decode token, but if it fails, fall back to guest mode
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = security.decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             # Invalid token - fall back to guest
-            guest_user = db.query(User).filter(User.username == "guest").first()
-            return guest_user if guest_user else create_guest_user(db)
+            return get_guest_user(db)
     except JWTError:
         # Invalid token - fall back to guest
-        guest_user = db.query(User).filter(User.username == "guest").first()
-        return guest_user if guest_user else create_guest_user(db)
+        return get_guest_user(db)
     
-    user = db.query(User).filter(User.username == username).first()
+    user = db.scalar(select(User).options(*USER_LOAD_OPTIONS).where(User.username == username))
     if user is None:
         # User not found - fall back to guest
-        guest_user = db.query(User).filter(User.username == "guest").first()
-        return guest_user if guest_user else create_guest_user(db)
+        return get_guest_user(db)
+    _cache_user_id(token, user.id, payload.get("exp"))
     return user
 
+def get_guest_user(db: Session) -> User:
+    """Return the guest user, looking it up by primary key once its id is known."""
+    global _guest_user_id
+    if _guest_user_id is not None:
+        guest_user = db.get(User, _guest_user_id, options=USER_LOAD_OPTIONS)
+        if guest_user is not None:
+            return guest_user
+
+    guest_user = db.scalar(select(User).options(*USER_LOAD_OPTIONS).where(User.username == "guest"))
+    if not guest_user:
+        # Guest user should have been created on startup
+        guest_user = create_guest_user(db)
+    _guest_user_id = guest_user.id
+    return guest_user
+
 def create_guest_user(db: Session) -> User:
     """Helper to create guest user."""
     guest_user = User(
         email="guest@fortes.local",
         username="guest",
-        hashed_password="$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYzxHGvz6YC",
+        hashed_password=security.GUEST_PASSWORD_SENTINEL,
         is_active=True
     )
     db.add(guest_user)
@@ -72,52 +127,52 @@ def create_guest_user(db: Session) -> User:
     return guest_user
 
 @router.post("/register", response_model=UserResponse)
-def register(*, db: Session = Depends(get_db), user_in: UserCreate) -> Any:
+async def register(*, db: AsyncSession = Depends(get_async_db), user_in: UserCreate) -> Any:
     """
     Register a new user.
     """
-    try:
-        # Check if user with this email exists
-        user = db.query(User).filter(User.email == user_in.email).first()
-        if user:
-            raise HTTPException(
-                status_code=400,
-                detail="A user with this email already exists.",
-            )
-        
-        # Check if user with this username exists
-        user = db.query(User).filter(User.username == user_in.username).first()
-        if user:
-            raise HTTPException(
-                status_code=400,
-                detail="A user with this username already exists.",
-            )
-        
-        # Create new user
-        user = User(
-            email=user_in.email,
-            username=user_in.username,
-            hashed_password=security.get_password_hash(user_in.password),
+    # Check email and username uniqueness in a single round-trip
+    existing_users = (await db.scalars(
+        select(User)
+        .where(or_(User.email == user_in.email, User.username == user_in.username))
+        .limit(2)
+    )).all()
+    if any(user.email == user_in.email for user in existing_users):
+        raise HTTPException(
+            status_code=400,
+            detail="A user with this email already exists.",
         )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        return user
-    except RequestException as e:
+    if existing_users:
         raise HTTPException(
-            status_code=503,
-            detail="Network error or server is unreachable. Please try again later.",
-        ) from e
+            status_code=400,
+            detail="A user with this username already exists.",
+        )
+    
+    # Create new user
+    user = User(
+        email=user_in.email,
+        username=user_in.username,
+        # bcrypt is CPU-bound; keep it off the event loop
+        hashed_password=await asyncio.to_thread(security.get_password_hash, user_in.password),
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
 
 @router.post("/token", response_model=Token)
-def login_access_token(
-    db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login_access_token(
+    db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests.
     """
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(
+        select(User).options(*USER_LOAD_OPTIONS).where(User.username == form_data.username)
+    )
+    if not user or not await asyncio.to_thread(
+        security.verify_password, form_data.password, user.hashed_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -137,7 +192,7 @@ def login_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/test-token", response_model=UserResponse)
-def test_token(current_user: User = Depends(get_current_user)) -> Any:
+async def test_token(current_user: User = Depends(get_current_user)) -> Any:
     """
     Test access token by getting current user.
     """
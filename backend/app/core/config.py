@@ -1,4 +1,5 @@
 import os
+from functools import cached_property
 from typing import List, Optional
 
 from pydantic_settings import BaseSettings
@@ -12,9 +13,9 @@ class Settings(BaseSettings):
     # Database Configuration
     RAG_STORE: str = os.getenv("RAG_STORE", "sqlite")  # sqlite | pinecone | mysql
     
-    @property
+    @cached_property
     def SQLITE_FILE(self) -> str:
-        """Get absolute path for SQLite database file."""
+        """Get absolute path for SQLite database file (resolved once)."""
         sqlite_path = os.getenv("SQLITE_FILE", "./data/fortes.db")
         if not os.path.isabs(sqlite_path):
             # Make it absolute relative to project root
@@ -34,7 +35,17 @@ class Settings(BaseSettings):
     MYSQL_DATABASE: str = os.getenv("MYSQL_DATABASE", "fortes")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
 
-    @property
+    # Connection pool settings (ignored for SQLite)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "25"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "25"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+    # The async engine (auth, startup) keeps its own smaller pool; worst-case
+    # connections are DB_POOL_SIZE + DB_MAX_OVERFLOW + ASYNC_DB_POOL_SIZE + ASYNC_DB_MAX_OVERFLOW
+    ASYNC_DB_POOL_SIZE: int = int(os.getenv("ASYNC_DB_POOL_SIZE", "5"))
+    ASYNC_DB_MAX_OVERFLOW: int = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "5"))
+
+    @cached_property
     def get_database_url(self) -> str:
         if self.RAG_DB_URL:
             return self.RAG_DB_URL
@@ -85,6 +96,7 @@ class Settings(BaseSettings):
     # Qdrant DB settings
     QDRANT_URL: str = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_PREFER_GRPC: bool = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+    QDRANT_INT8_QUANTIZATION: bool = os.getenv("QDRANT_INT8_QUANTIZATION", "true").lower() == "true"
 
     # Deepseek settings
     DEEPSEEK_API_KEY: str = ""
@@ -118,6 +130,7 @@ class Settings(BaseSettings):
     ENABLE_TOKEN_LOGGING: bool = os.getenv("ENABLE_TOKEN_LOGGING", "true").lower() == "true"
     ENABLE_COST_TRACKING: bool = os.getenv("ENABLE_COST_TRACKING", "true").lower() == "true"
     ENABLE_PROMPT_CACHE: bool = os.getenv("ENABLE_PROMPT_CACHE", "true").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
 
     # Generation Model Configuration
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
@@ -1,13 +1,67 @@
+from typing import Any, AsyncGenerator, Dict
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from app.core.config import settings
 
-engine = create_engine(settings.get_database_url)
+# Async drivers for the sync URLs produced by settings.get_database_url
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+
+def _engine_options(url: str, pool_size: int, max_overflow: int) -> Dict[str, Any]:
+    """Pool and connect options suited to the database backend."""
+    if url.startswith("sqlite"):
+        # FastAPI runs sync endpoints on a threadpool, so connections cross threads
+        options: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}
+        if url.partition("://")[2].lstrip("/") in ("", ":memory:"):
+            # In-memory databases only exist on a single shared connection
+            options["poolclass"] = StaticPool
+        return options
+
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def create_db_engine(url: str) -> Engine:
+    """Create an engine with pooling suited to the database backend."""
+    return create_engine(url, **_engine_options(url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW))
+
+
+def get_async_database_url(url: str) -> str:
+    """Swap the sync driver in a database URL for its asyncio counterpart."""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+engine = create_db_engine(settings.get_database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    get_async_database_url(settings.get_database_url),
+    **_engine_options(settings.get_database_url, settings.ASYNC_DB_POOL_SIZE, settings.ASYNC_DB_MAX_OVERFLOW),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,77 +1,92 @@
+import asyncio
 import logging
+import os
+from contextlib import asynccontextmanager
 
 from app.api.api_v1.api import api_router
 from app.api.openapi.api import router as openapi_router
 from app.core.config import settings
 from app.core.minio import init_minio
+from app.core.security import GUEST_PASSWORD_SENTINEL
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.user import User
 from app.startup.migarate import DatabaseMigrator
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import select, text
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
+logger = logging.getLogger(__name__)
+
+_API_PREFIX = settings.API_V1_STR
+_OPENAPI_URL = f"{_API_PREFIX}/openapi.json"
+_ALLOWED_ORIGINS = ("http://localhost:3000", "http://localhost:3001", "http://localhost:3002")
+
+
+def run_migrations():
+    migrator = DatabaseMigrator(settings.get_database_url)
+    migrator.run_migrations()
+
+
+async def ensure_guest_user():
+    """Create guest user for development (no-auth mode)"""
+    try:
+        async with AsyncSessionLocal() as db:
+            guest_user = await db.scalar(select(User).where(User.username == "guest"))
+
+            if not guest_user:
+                # Guest password is a sentinel checked without bcrypt
+                guest_user = User(
+                    email="guest@fortes.local",
+                    username="guest",
+                    hashed_password=GUEST_PASSWORD_SENTINEL,
+                    is_active=True
+                )
+                db.add(guest_user)
+                await db.commit()
+                logger.info("✅ Guest user created for no-auth mode")
+            else:
+                logger.info("✅ Guest user already exists")
+    except Exception as e:
+        logger.warning(f"Guest user creation failed (non-critical): {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # MinIO and migrations are independent blocking calls; run them side by side
+    await asyncio.gather(
+        asyncio.to_thread(init_minio),
+        asyncio.to_thread(run_migrations),
+    )
+    # The guest user needs the migrated users table
+    await ensure_guest_user()
+    yield
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    openapi_url=_OPENAPI_URL,
+    lifespan=lifespan,
 )
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://localhost:3001", "http://localhost:3002"],
+    allow_origins=_ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 # Include routers
-app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(api_router, prefix=_API_PREFIX)
 app.include_router(openapi_router, prefix="/openapi")
 
 
-@app.on_event("startup")
-async def startup_event():
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    # Initialize MinIO
-    init_minio()
-    
-    # Run database migrations
-    migrator = DatabaseMigrator(settings.get_database_url)
-    migrator.run_migrations()
-    
-    # Create guest user for development (no-auth mode)
-    try:
-        from app.db.session import SessionLocal
-        from app.models.user import User
-        
-        db = SessionLocal()
-        guest_user = db.query(User).filter(User.username == "guest").first()
-        
-        if not guest_user:
-            # Create guest user with simple password (bcrypt will handle it)
-            guest_user = User(
-                email="guest@fortes.local",
-                username="guest",
-                hashed_password="$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewY5GyYzxHGvz6YC",  # Pre-hashed "guest"
-                is_active=True
-            )
-            db.add(guest_user)
-            db.commit()
-            logger.info("✅ Guest user created for no-auth mode")
-        else:
-            logger.info("✅ Guest user already exists")
-        
-        db.close()
-    except Exception as e:
-        logger.warning(f"Guest user creation failed (non-critical): {e}")
-
-
 @app.get("/")
 def root():
     return {
@@ -89,9 +104,6 @@ def root():
 
 @app.get("/api/health")
 async def health_check():
-    import os
-    from app.db.session import SessionLocal
-    
     # Get absolute DB path
     db_url = settings.get_database_url
     if "sqlite" in db_url:
@@ -105,10 +117,8 @@ async def health_check():
     # Test DB connection
     db_status = "ok"
     try:
-        from sqlalchemy import text
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        db.close()
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
     except Exception as e:
         db_status = f"error: {str(e)}"
     
@@ -5,9 +5,12 @@ Implements sentence-level citation mapping and unsupported content flagging
 
 import re
 import logging
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Set, Tuple
 from dataclasses import dataclass
 
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,50 +34,55 @@ class AnnotatedSentence:
     confidence: float
 
 
+@dataclass
+class ChunkTokenIndex:
+    """Token-set index over retrieved chunks for vectorized overlap scoring"""
+    vocab: Dict[str, int]
+    matrix: np.ndarray  # (num_chunks, vocab_size) token membership
+    sizes: np.ndarray  # number of distinct tokens per chunk
+
+
 class AttributionService:
     """Service for sentence-level attribution and hallucination detection"""
 
     # Minimum similarity threshold for citation support
     CITATION_THRESHOLD = 0.65
+
+    # Minimum cosine similarity for citation support when scoring with embeddings
+    EMBEDDING_CITATION_THRESHOLD = 0.5
     
     # Minimum number of citations required for support
     MIN_CITATIONS = 1
 
     def __init__(self):
-        # Pattern for sentence splitting (handles common abbreviations)
+        # Pattern for sentence splitting. The lookbehinds skip abbreviations
+        # (e.g., i.e., Dr., Mr., Ms., Mrs., etc.) so the text is scanned once.
         self.sentence_pattern = re.compile(
-            r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|\!)\s'
+            r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<!Mrs\.)(?<!etc\.)(?<=\.|\?|\!)\s'
         )
 
     def split_into_sentences(self, text: str) -> List[str]:
         """
         Split text into sentences, handling common edge cases
         """
-        # Handle common abbreviations
-        text = text.replace("e.g.", "e~g~")
-        text = text.replace("i.e.", "i~e~")
-        text = text.replace("etc.", "etc~")
-        text = text.replace("Dr.", "Dr~")
-        text = text.replace("Mr.", "Mr~")
-        text = text.replace("Mrs.", "Mrs~")
-        text = text.replace("Ms.", "Ms~")
-        
         sentences = self.sentence_pattern.split(text)
-        
-        # Restore abbreviations
-        sentences = [
-            s.replace("e~g~", "e.g.")
-             .replace("i~e~", "i.e.")
-             .replace("etc~", "etc.")
-             .replace("Dr~", "Dr.")
-             .replace("Mr~", "Mr.")
-             .replace("Mrs~", "Mrs.")
-             .replace("Ms~", "Ms.")
-             .strip()
-            for s in sentences if s.strip()
-        ]
-        
-        return sentences
+        return [s.strip() for s in sentences if s.strip()]
+
+    def tokenize(self, text: str) -> Set[str]:
+        """Lowercased word set used for overlap scoring"""
+        return set(text.lower().split())
+
+    def chunk_tokens(self, chunk: Dict[str, Any]) -> Set[str]:
+        """
+        Word set of a chunk's content, cached on the chunk under ``_tokens``
+
+        Chunks are scored against every sentence of a response, so each one
+        is tokenized once and reused.
+        """
+        tokens = chunk.get("_tokens")
+        if tokens is None:
+            tokens = chunk["_tokens"] = self.tokenize(chunk.get("content", ""))
+        return tokens
 
     def calculate_sentence_similarity(
         self, 
@@ -86,100 +94,291 @@ class AttributionService:
         Uses simple word overlap for now (can be replaced with embeddings)
         """
         # Normalize text
-        sentence_words = set(sentence.lower().split())
-        chunk_words = set(chunk.get("content", "").lower().split())
+        sentence_words = self.tokenize(sentence)
+        chunk_words = self.chunk_tokens(chunk)
         
         if not sentence_words or not chunk_words:
             return 0.0
         
-        # Jaccard similarity
-        intersection = sentence_words.intersection(chunk_words)
-        union = sentence_words.union(chunk_words)
-        
-        return len(intersection) / len(union) if union else 0.0
+        # Jaccard similarity: count the overlap by probing the larger set with
+        # the smaller one, and derive the union size instead of building it
+        if len(sentence_words) > len(chunk_words):
+            sentence_words, chunk_words = chunk_words, sentence_words
+        intersection = sum(1 for word in sentence_words if word in chunk_words)
+        union = len(sentence_words) + len(chunk_words) - intersection
+
+        return intersection / union if union else 0.0
+
+    def build_chunk_index(self, chunks: List[Dict[str, Any]]) -> ChunkTokenIndex:
+        """
+        Tokenize each chunk once into a shared vocabulary and a membership matrix
+        """
+        vocab: Dict[str, int] = {}
+        token_sets = [self.chunk_tokens(chunk) for chunk in chunks]
+        sizes = np.fromiter(map(len, token_sets), dtype=np.int64, count=len(token_sets))
+        token_ids = np.fromiter(
+            (vocab.setdefault(word, len(vocab)) for words in token_sets for word in words),
+            dtype=np.int64,
+            count=int(sizes.sum())
+        )
+
+        # Scatter every (chunk, token) pair in a single assignment
+        matrix = np.zeros((len(chunks), len(vocab)), dtype=np.float32)
+        matrix[np.repeat(np.arange(len(chunks)), sizes), token_ids] = 1.0
+
+        return ChunkTokenIndex(vocab=vocab, matrix=matrix, sizes=sizes.astype(np.float64))
+
+    def jaccard_similarity_matrix(self, sentences: List[str], index: ChunkTokenIndex) -> np.ndarray:
+        """
+        Jaccard similarity of every sentence against every indexed chunk, shape (sentences, chunks)
+        """
+        token_sets = [self.tokenize(sentence) for sentence in sentences]
+        sentence_sizes = np.fromiter(map(len, token_sets), dtype=np.float64, count=len(token_sets))
+
+        # Only words present in some chunk can contribute to an intersection
+        rows, cols = [], []
+        for row, words in enumerate(token_sets):
+            for word in words:
+                token_id = index.vocab.get(word)
+                if token_id is not None:
+                    rows.append(row)
+                    cols.append(token_id)
+
+        sentence_matrix = np.zeros((len(sentences), len(index.vocab)), dtype=np.float32)
+        sentence_matrix[rows, cols] = 1.0
+
+        intersection = (sentence_matrix @ index.matrix.T).astype(np.float64)
+        union = sentence_sizes[:, None] + index.sizes[None, :] - intersection
+
+        # Empty sentences or chunks score 0.0, matching calculate_sentence_similarity
+        valid = (sentence_sizes[:, None] > 0) & (index.sizes[None, :] > 0)
+        return np.where(valid, intersection / np.maximum(union, 1.0), 0.0)
+
+    def score_chunks(self, sentence: str, index: ChunkTokenIndex) -> np.ndarray:
+        """
+        Jaccard similarity between a sentence and every indexed chunk in one pass
+        """
+        return self.jaccard_similarity_matrix([sentence], index)[0]
+
+    def embedding_similarity_matrix(
+        self,
+        sentences: List[str],
+        chunks: List[Dict[str, Any]],
+        embeddings: Embeddings
+    ) -> np.ndarray:
+        """
+        Cosine similarity of every sentence against every chunk, shape (sentences, chunks)
+
+        Chunks must carry the ``embedding`` retrieval found them by; only the
+        sentences are embedded, in a single batch call.
+        """
+        sentence_matrix = np.asarray(embeddings.embed_documents(sentences), dtype=np.float32)
+        chunk_matrix = np.asarray([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+
+        sentence_matrix /= np.maximum(np.linalg.norm(sentence_matrix, axis=1, keepdims=True), 1e-12)
+        chunk_matrix /= np.maximum(np.linalg.norm(chunk_matrix, axis=1, keepdims=True), 1e-12)
+        return (sentence_matrix @ chunk_matrix.T).astype(np.float64)
+
+    def _rank_supporting(self, similarities: np.ndarray, threshold: float, top_k: int) -> np.ndarray:
+        """Indices of the top-k chunks meeting the threshold, best first"""
+        candidates = np.flatnonzero(similarities >= threshold)
+
+        # Partial selection: only candidates scoring at least the k-th best
+        # (ties included, so retrieval order still decides between them) need sorting
+        if 0 < top_k < len(candidates):
+            scores = similarities[candidates]
+            kth_best = np.partition(scores, -top_k)[-top_k]
+            candidates = candidates[scores >= kth_best]
+
+        # Sort by similarity (stable, so ties keep retrieval order) and keep top-k
+        return candidates[np.argsort(-similarities[candidates], kind="stable")][:top_k]
+
+    def select_citations(
+        self,
+        similarities: np.ndarray,
+        chunks: List[Dict[str, Any]],
+        threshold: float,
+        top_k: int = 3
+    ) -> List[Citation]:
+        """
+        Build citations for the top-k chunks whose similarity meets the threshold
+        """
+        citations = []
+        for i in self._rank_supporting(similarities, threshold, top_k):
+            chunk = chunks[i]
+            citations.append(Citation(
+                doc_id=chunk.get("doc_id", "unknown"),
+                chunk_id=chunk.get("chunk_id", "unknown"),
+                line_start=chunk.get("line_start", 0),
+                line_end=chunk.get("line_end", 0),
+                similarity_score=float(similarities[i]),
+                chunk_text=chunk.get("content", "")[:200]  # First 200 chars
+            ))
+
+        return citations
 
     def find_supporting_chunks(
         self, 
         sentence: str, 
         chunks: List[Dict[str, Any]],
-        top_k: int = 3
+        top_k: int = 3,
+        index: Optional[ChunkTokenIndex] = None
     ) -> List[Citation]:
         """
         Find chunks that support a given sentence
+
+        Pass a prebuilt ``index`` when scoring many sentences against the same chunks.
         """
-        citations = []
-        
-        for chunk in chunks:
-            similarity = self.calculate_sentence_similarity(sentence, chunk)
-            
-            if similarity >= self.CITATION_THRESHOLD:
-                citation = Citation(
-                    doc_id=chunk.get("doc_id", "unknown"),
-                    chunk_id=chunk.get("chunk_id", "unknown"),
-                    line_start=chunk.get("line_start", 0),
-                    line_end=chunk.get("line_end", 0),
-                    similarity_score=similarity,
-                    chunk_text=chunk.get("content", "")[:200]  # First 200 chars
-                )
-                citations.append(citation)
-        
-        # Sort by similarity and return top-k
-        citations.sort(key=lambda c: c.similarity_score, reverse=True)
-        return citations[:top_k]
+        if index is None:
+            index = self.build_chunk_index(chunks)
 
-    def annotate_response(
-        self, 
-        response_text: str, 
-        retrieved_chunks: List[Dict[str, Any]]
-    ) -> Tuple[List[AnnotatedSentence], bool, Dict[str, Any]]:
+        similarities = self.score_chunks(sentence, index)
+        return self.select_citations(similarities, chunks, self.CITATION_THRESHOLD, top_k)
+
+    def _score_response(
+        self,
+        response_text: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        embeddings: Optional[Embeddings]
+    ) -> Tuple[List[str], np.ndarray, float, np.ndarray, np.ndarray]:
         """
-        Annotate response with sentence-level citations and detect hallucinations
-        
+        Split a response and score every sentence against every chunk
+
         Returns:
-            Tuple of (annotated_sentences, has_hallucination, stats)
+            Tuple of (sentences, similarity_matrix, threshold, supported, confidences)
         """
         sentences = self.split_into_sentences(response_text)
-        annotated_sentences = []
-        unsupported_count = 0
-        
-        for sentence in sentences:
-            if not sentence.strip():
-                continue
-                
-            citations = self.find_supporting_chunks(sentence, retrieved_chunks)
-            is_supported = len(citations) >= self.MIN_CITATIONS
-            
-            if not is_supported:
-                unsupported_count += 1
-            
-            confidence = max([c.similarity_score for c in citations], default=0.0)
-            
-            annotated = AnnotatedSentence(
-                text=sentence,
-                citations=citations,
-                is_supported=is_supported,
-                confidence=confidence
+        similarity_matrix = None
+        threshold = self.CITATION_THRESHOLD
+        has_chunk_vectors = all(chunk.get("embedding") is not None for chunk in retrieved_chunks)
+        if embeddings is not None and sentences and retrieved_chunks and has_chunk_vectors:
+            try:
+                similarity_matrix = self.embedding_similarity_matrix(
+                    sentences, retrieved_chunks, embeddings
+                )
+                threshold = self.EMBEDDING_CITATION_THRESHOLD
+            except Exception as e:
+                logger.warning(f"Embedding attribution failed, using word overlap: {e}")
+
+        if similarity_matrix is None:
+            similarity_matrix = self.jaccard_similarity_matrix(
+                sentences, self.build_chunk_index(retrieved_chunks)
             )
-            annotated_sentences.append(annotated)
-        
+
+        # Per-sentence support and confidence straight from the score matrix
+        above_threshold = similarity_matrix >= threshold
+        supported = above_threshold.sum(axis=1) >= self.MIN_CITATIONS
+        if similarity_matrix.shape[1]:
+            confidences = np.where(above_threshold.any(axis=1), similarity_matrix.max(axis=1), 0.0)
+        else:
+            confidences = np.zeros(len(sentences))
+
+        return sentences, similarity_matrix, threshold, supported, confidences
+
+    def _summarize(self, supported: np.ndarray, confidences: np.ndarray) -> Tuple[bool, Dict[str, Any]]:
+        """Hallucination flag and attribution stats for a scored response"""
+        total = len(supported)
+        unsupported_count = int(total - supported.sum())
         has_hallucination = unsupported_count > 0
         
         stats = {
-            "total_sentences": len(annotated_sentences),
-            "supported_sentences": len(annotated_sentences) - unsupported_count,
+            "total_sentences": total,
+            "supported_sentences": total - unsupported_count,
             "unsupported_sentences": unsupported_count,
-            "hallucination_rate": unsupported_count / len(annotated_sentences) if annotated_sentences else 0.0,
-            "average_confidence": sum(s.confidence for s in annotated_sentences) / len(annotated_sentences) if annotated_sentences else 0.0
+            "hallucination_rate": unsupported_count / total if total else 0.0,
+            "average_confidence": float(confidences.mean()) if total else 0.0
         }
         
         if has_hallucination:
             logger.warning(
-                f"Hallucination detected: {unsupported_count}/{len(annotated_sentences)} "
+                f"Hallucination detected: {unsupported_count}/{total} "
                 f"sentences lack sufficient support"
             )
         
+        return has_hallucination, stats
+
+    def annotate_response(
+        self, 
+        response_text: str, 
+        retrieved_chunks: List[Dict[str, Any]],
+        embeddings: Optional[Embeddings] = None
+    ) -> Tuple[List[AnnotatedSentence], bool, Dict[str, Any]]:
+        """
+        Annotate response with sentence-level citations and detect hallucinations
+
+        With ``embeddings`` and an ``embedding`` on every chunk, sentences are
+        matched to chunks by cosine similarity; otherwise (or if embedding
+        fails) by word-overlap Jaccard similarity.
+        
+        Returns:
+            Tuple of (annotated_sentences, has_hallucination, stats)
+        """
+        sentences, similarity_matrix, threshold, supported, confidences = self._score_response(
+            response_text, retrieved_chunks, embeddings
+        )
+
+        annotated_sentences = [
+            AnnotatedSentence(
+                text=sentence,
+                citations=self.select_citations(similarity_matrix[row], retrieved_chunks, threshold),
+                is_supported=bool(supported[row]),
+                confidence=float(confidences[row])
+            )
+            for row, sentence in enumerate(sentences)
+        ]
+
+        has_hallucination, stats = self._summarize(supported, confidences)
         return annotated_sentences, has_hallucination, stats
 
+    def annotate_response_for_api(
+        self,
+        response_text: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        embeddings: Optional[Embeddings] = None
+    ) -> Tuple[Dict[str, Any], bool, Dict[str, Any]]:
+        """
+        Annotate a response straight into the API citation format
+
+        Equivalent to annotate_response followed by format_citations_for_response,
+        without building the intermediate AnnotatedSentence/Citation objects.
+
+        Returns:
+            Tuple of (attribution_data, has_hallucination, stats)
+        """
+        sentences, similarity_matrix, threshold, supported, confidences = self._score_response(
+            response_text, retrieved_chunks, embeddings
+        )
+
+        formatted_sentences = []
+        for row, sentence in enumerate(sentences):
+            similarities = similarity_matrix[row]
+            formatted_citations = []
+            for i in self._rank_supporting(similarities, threshold, top_k=3):
+                chunk = retrieved_chunks[i]
+                formatted_citations.append({
+                    "doc_id": chunk.get("doc_id", "unknown"),
+                    "chunk_id": chunk.get("chunk_id", "unknown"),
+                    "line_range": f"{chunk.get('line_start', 0)}-{chunk.get('line_end', 0)}",
+                    "similarity": round(float(similarities[i]), 3),
+                    "preview": chunk.get("content", "")[:200]
+                })
+
+            is_supported = bool(supported[row])
+            formatted_sentences.append({
+                "text": sentence,
+                "citations": formatted_citations,
+                "is_supported": is_supported,
+                "confidence": round(float(confidences[row]), 3),
+                "hallucination_flag": not is_supported
+            })
+
+        has_hallucination, stats = self._summarize(supported, confidences)
+        attribution_data = {
+            "sentences": formatted_sentences,
+            "has_hallucination": has_hallucination
+        }
+        return attribution_data, has_hallucination, stats
+
     def format_citations_for_response(
         self, 
         annotated_sentences: List[AnnotatedSentence]
@@ -225,8 +424,7 @@ class AttributionService:
             return 0.0
         
         # Use the maximum similarity score from top chunks
-        scores = [chunk.get("score", 0.0) for chunk in retrieved_chunks]
-        return max(scores) if scores else 0.0
+        return max(chunk.get("score", 0.0) for chunk in retrieved_chunks)
 
 
 # Singleton instance
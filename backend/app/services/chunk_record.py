@@ -1,7 +1,6 @@
 from typing import Optional, List, Dict, Set
-from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
-from app.core.config import settings
+from app.db.session import engine
 from app.models.knowledge import DocumentChunk
 import json
 
@@ -9,7 +8,7 @@ class ChunkRecord:
     """Manages chunk-level record keeping for incremental updates"""
     def __init__(self, kb_id: int):
         self.kb_id = kb_id
-        self.engine = create_engine(settings.get_database_url)
+        self.engine = engine
     
     def list_chunks(self, file_name: Optional[str] = None) -> Set[str]:
         """List all chunk hashes for the given file"""
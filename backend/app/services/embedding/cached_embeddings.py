@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    In-process LRU + TTL cache in front of another embeddings model.
+    Vectors are keyed on a digest of the text, so repeated queries and
+    re-ingested chunks skip the provider round-trip. Queries and documents
+    are cached separately since some providers embed them differently.
+    A hit returns the cached list object itself, so callers must not mutate it.
+    """
+
+    def __init__(self, inner: Embeddings, max_size: int = 10_000, ttl_seconds: int = 3600):
+        self.inner = inner
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._cache: "OrderedDict[bytes, Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(kind: bytes, text: str) -> bytes:
+        return kind + hashlib.sha1(text.encode()).digest()
+
+    def _get(self, key: bytes) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            vector, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return vector
+
+    def _put(self, key: bytes, vector: List[float]) -> None:
+        with self._lock:
+            self._cache[key] = (vector, time.monotonic() + self.ttl_seconds)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(b"q", text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(b"q", text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.inner.aembed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def _lookup_documents(self, texts: List[str]):
+        """Cached vectors in input order, plus the de-duplicated misses"""
+        keys = [self._key(b"d", text) for text in texts]
+        vectors: List[Optional[List[float]]] = [self._get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        unique = {keys[i]: texts[i] for i in missing}
+        return keys, vectors, missing, unique
+
+    def _fill_documents(self, keys, vectors, missing, unique, embedded) -> List[List[float]]:
+        fresh = dict(zip(unique.keys(), embedded))
+        for key, vector in fresh.items():
+            self._put(key, vector)
+        for i in missing:
+            vectors[i] = fresh[keys[i]]
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing, unique = self._lookup_documents(texts)
+
+        # Embed only the misses, in one batch call, de-duplicated
+        if not missing:
+            return vectors
+        embedded = self.inner.embed_documents(list(unique.values()))
+        return self._fill_documents(keys, vectors, missing, unique, embedded)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing, unique = self._lookup_documents(texts)
+
+        # Misses go to the provider's native async client, not a worker thread
+        if not missing:
+            return vectors
+        embedded = await self.inner.aembed_documents(list(unique.values()))
+        return self._fill_documents(keys, vectors, missing, unique, embedded)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
@@ -1,5 +1,10 @@
 import logging
+from functools import lru_cache
+from typing import Tuple
+
+import httpx
 from app.core.config import settings
+from app.services.embedding.cached_embeddings import CachedEmbeddings
 from langchain_openai import OpenAIEmbeddings
 from langchain_ollama import OllamaEmbeddings
 from langchain_community.embeddings import DashScopeEmbeddings
@@ -13,38 +18,72 @@ class EmbeddingsFactory:
         """
         Factory method to create an embeddings instance with automatic fallback to stub.
         Falls back to stub embeddings if API key is missing or invalid.
-        """
-        embeddings_provider = settings.EMBEDDINGS_PROVIDER.lower()
 
+        Instances are shared per (provider, api_key, base_url, model) so callers
+        reuse one client, its HTTP connection pool and its embedding cache.
+        A failed initialization is not cached: the stub serves this call only
+        and the next call retries the real provider.
+        """
         try:
-            if embeddings_provider == "openai":
-                # Check if API key is configured
-                if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "your-openai-api-key-here":
-                    logger.warning("⚠️  No valid OpenAI API key found. Falling back to stub embeddings.")
-                    from app.services.stub_services import create_stub_embeddings
-                    return create_stub_embeddings()
-                
-                logger.info(f"✓ Using OpenAI embeddings: {settings.OPENAI_EMBEDDINGS_MODEL}")
-                return OpenAIEmbeddings(
-                    openai_api_key=settings.OPENAI_API_KEY,
-                    openai_api_base=settings.OPENAI_API_BASE,
-                    model=settings.OPENAI_EMBEDDINGS_MODEL
-                )
-            elif embeddings_provider == "dashscope":
-                return DashScopeEmbeddings(
-                    model=settings.DASH_SCOPE_EMBEDDINGS_MODEL,
-                    dashscope_api_key=settings.DASH_SCOPE_API_KEY
-                )
-            elif embeddings_provider == "ollama":
-                return OllamaEmbeddings(
-                    model=settings.OLLAMA_EMBEDDINGS_MODEL,
-                    base_url=settings.OLLAMA_API_BASE
-                )
-            else:
-                raise ValueError(f"Unsupported embeddings provider: {embeddings_provider}")
-        
+            return EmbeddingsFactory._create_cached(*EmbeddingsFactory._config_key())
         except Exception as e:
-            logger.error(f"Failed to initialize {embeddings_provider} embeddings: {e}")
+            logger.error(f"Failed to initialize {settings.EMBEDDINGS_PROVIDER} embeddings: {e}")
             logger.warning("Falling back to stub embeddings for development/testing")
             from app.services.stub_services import create_stub_embeddings
             return create_stub_embeddings()
+
+    @staticmethod
+    def _config_key() -> Tuple[str, str, str, str]:
+        """Read the settings that identify an embeddings client"""
+        embeddings_provider = settings.EMBEDDINGS_PROVIDER.lower()
+        if embeddings_provider == "openai":
+            return (
+                embeddings_provider,
+                settings.OPENAI_API_KEY,
+                settings.OPENAI_API_BASE,
+                settings.OPENAI_EMBEDDINGS_MODEL,
+            )
+        elif embeddings_provider == "dashscope":
+            return (embeddings_provider, settings.DASH_SCOPE_API_KEY, "", settings.DASH_SCOPE_EMBEDDINGS_MODEL)
+        elif embeddings_provider == "ollama":
+            return (embeddings_provider, "", settings.OLLAMA_API_BASE, settings.OLLAMA_EMBEDDINGS_MODEL)
+        return (embeddings_provider, "", "", "")
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _create_cached(embeddings_provider: str, api_key: str, base_url: str, model: str):
+        # lru_cache does not cache exceptions, so a failed build is retried
+        return CachedEmbeddings(
+            EmbeddingsFactory._build(embeddings_provider, api_key, base_url, model)
+        )
+
+    @staticmethod
+    def _build(embeddings_provider: str, api_key: str, base_url: str, model: str):
+        if embeddings_provider == "openai":
+            # Check if API key is configured
+            if not api_key or api_key == "your-openai-api-key-here":
+                logger.warning("⚠️  No valid OpenAI API key found. Falling back to stub embeddings.")
+                from app.services.stub_services import create_stub_embeddings
+                return create_stub_embeddings()
+
+            logger.info(f"✓ Using OpenAI embeddings: {model}")
+            return OpenAIEmbeddings(
+                openai_api_key=api_key,
+                openai_api_base=base_url,
+                model=model,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+                ),
+            )
+        elif embeddings_provider == "dashscope":
+            return DashScopeEmbeddings(
+                model=model,
+                dashscope_api_key=api_key
+            )
+        elif embeddings_provider == "ollama":
+            return OllamaEmbeddings(
+                model=model,
+                base_url=base_url
+            )
+        else:
+            raise ValueError(f"Unsupported embeddings provider: {embeddings_provider}")
@@ -4,27 +4,119 @@ Integrates guardrails, attribution, observability, and advanced RAG features
 """
 
 import json
-import base64
+import asyncio
 import logging
-from typing import List, AsyncGenerator, Dict, Any, Optional
+import xxhash
+from typing import List, AsyncGenerator, Dict, Any, Optional, Set
 from sqlalchemy.orm import Session
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.documents import Document as LangchainDocument
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
 from app.core.config import settings
 from app.models.chat import Message
-from app.models.knowledge import KnowledgeBase, Document
+from app.models.knowledge import Document
 from app.services.vector_store import VectorStoreFactory
 from app.services.embedding.embedding_factory import EmbeddingsFactory
 from app.services.llm.llm_factory import LLMFactory
 from app.services.guardrails import guardrails_service
 from app.services.attribution import attribution_service
 from app.services.observability import observability_service
+from app.services.stub_services import is_stub_embeddings
 
 logger = logging.getLogger(__name__)
 
+# Prompts hold no per-request state, so they are built once at import
+_CONTEXTUALIZE_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, just "
+    "reformulate it if needed and otherwise return it as is."
+)
+_CONTEXTUALIZE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", _CONTEXTUALIZE_SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}")
+])
+
+# Enhanced QA prompt with Fortes Education branding
+_QA_SYSTEM_PROMPT = (
+    "You are Fortes Education Assistant, an expert Q&A system powered by RAG technology. "
+    "You will be given a user question and a set of related contexts to answer it. "
+    "Each context has an implicit reference number based on its position (first context is 1, second is 2, etc.). "
+    "Please provide a clean, concise, and accurate answer using these contexts. "
+    "IMPORTANT: Cite your sources using the format [citation:x] at the end of each sentence where applicable. "
+    "If a sentence draws from multiple contexts, list all citations, like [citation:1][citation:2]. "
+    "If the contexts don't provide sufficient information, say 'I don't have enough information about' followed by the topic. "
+    "Limit your answer to 1024 tokens. Be professional, unbiased, and concise."
+)
+# The instructions stay byte-identical across requests and the chat history
+# only grows, so both form a stable prefix for provider-side prompt caching;
+# the per-request context goes in its own message after them.
+_QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", _QA_SYSTEM_PROMPT),
+    MessagesPlaceholder("chat_history"),
+    ("system", "Context: {context}"),
+    ("human", "{input}")
+])
+
+_DOC_PROMPT = PromptTemplate.from_template("\n\n- {page_content}\n\n")
+
+
+def _frame(frame_type: str, text: str) -> str:
+    """Encode text as a stream frame; json.dumps escapes quotes, backslashes and control chars"""
+    return f'{frame_type}:{json.dumps(text)}\n'
+
+
+def _query_cache_key(query: str) -> str:
+    """Hash the case- and whitespace-normalized query so trivial rewordings share a cache entry"""
+    normalized = " ".join(query.casefold().split())
+    return xxhash.xxh3_64_hexdigest(normalized.encode())
+
+
+def _reciprocal_rank_fusion(
+    result_lists: List[List[LangchainDocument]],
+    rrf_k: int = 60
+) -> List[LangchainDocument]:
+    """
+    Merge ranked result lists by Reciprocal Rank Fusion
+
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in;
+    documents are identified by page content, as in EnsembleRetriever.
+    """
+    scores: Dict[str, float] = {}
+    documents: Dict[str, LangchainDocument] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(doc.page_content, doc)
+
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def _start_exchange(db: Session, knowledge_base_ids: List[int], new_messages: List[Message]) -> Set[int]:
+    """
+    Find the knowledge bases that have documents and insert the new messages
+
+    One commit inserts the messages and ends the transaction, so no
+    connection is held while the response streams.
+    """
+    populated_kb_ids = {
+        kb_id for (kb_id,) in (
+            db.query(Document.knowledge_base_id)
+            .filter(Document.knowledge_base_id.in_(knowledge_base_ids))
+            .distinct()
+        )
+    }
+    db.add_all(new_messages)
+    db.commit()
+    return populated_kb_ids
+
 
 async def generate_enhanced_response(
     query: str,
@@ -35,15 +127,19 @@ async def generate_enhanced_response(
 ) -> AsyncGenerator[str, None]:
     """
     Enhanced response generation with guardrails, attribution, and observability
+
+    Blocking work (regex guardrails, embedding calls, database commits and
+    attribution) runs in worker threads so the event loop keeps serving other
+    streams.
     """
     try:
         # Step 1: Apply input guardrails
-        guardrail_result = guardrails_service.process_query(query)
+        guardrail_result = await asyncio.to_thread(guardrails_service.process_query, query)
         
         if guardrail_result["injection_detected"]:
             # Return refusal for severe injection attempts
             refusal = guardrails_service.create_refusal_response("injection")
-            yield f'0:"{refusal}"\n'
+            yield _frame("0", refusal)
             yield 'd:{"finishReason":"stop","usage":{"promptTokens":0,"completionTokens":0}}\n'
             
             # Log the incident
@@ -55,42 +151,49 @@ async def generate_enhanced_response(
         
         # Step 2: Check prompt cache
         corpus_id = "_".join(map(str, knowledge_base_ids))
-        cached_response = observability_service.get_cached_response(query, corpus_id)
+        query_key = _query_cache_key(query)
+        cached_response = observability_service.get_cached_response(query_key, corpus_id)
         
         if cached_response:
             logger.info("✓ Returning cached response")
-            yield f'0:"{cached_response["response"]}"\n'
+            yield _frame("0", cached_response["response"])
             yield f'd:{json.dumps(cached_response["metadata"])}\n'
             return
         
-        # Create user message
+        # Initialize embeddings
+        embeddings = EmbeddingsFactory.create()
+
+        # Check for a cached answer to a reworded form of the same question.
+        # The embeddings wrapper caches the query vector, so retrieval reuses it.
+        # cache_embedding is always the vector of processed_query, so answers
+        # are stored under the same key later lookups compute.
+        cache_embedding = None
+        if settings.ENABLE_PROMPT_CACHE:
+            cache_embedding = await asyncio.to_thread(embeddings.embed_query, processed_query)
+            cached_response = observability_service.get_similar_cached_response(cache_embedding, corpus_id)
+
+            if cached_response:
+                logger.info("✓ Returning semantically cached response")
+                yield _frame("0", cached_response["response"])
+                yield f'd:{json.dumps(cached_response["metadata"])}\n'
+                return
+        
+        # Step 3: Create user message and bot message placeholder, and find
+        # the knowledge bases that have documents
         user_message = Message(
             content=query,
             role="user",
             chat_id=chat_id
         )
-        db.add(user_message)
-        db.commit()
-        
-        # Create bot message placeholder
         bot_message = Message(
             content="",
             role="assistant",
             chat_id=chat_id
         )
-        db.add(bot_message)
-        db.commit()
-        
-        # Step 3: Retrieve knowledge bases
-        knowledge_bases = (
-            db.query(KnowledgeBase)
-            .filter(KnowledgeBase.id.in_(knowledge_base_ids))
-            .all()
+        populated_kb_ids = await asyncio.to_thread(
+            _start_exchange, db, knowledge_base_ids, [user_message, bot_message]
         )
         
-        # Initialize embeddings
-        embeddings = EmbeddingsFactory.create()
-        
         # Log embedding model usage
         observability_service.log_embedding_request(
             text=processed_query,
@@ -99,109 +202,92 @@ async def generate_enhanced_response(
         
         # Create vector stores
         vector_stores = []
-        for kb in knowledge_bases:
-            documents = db.query(Document).filter(Document.knowledge_base_id == kb.id).all()
-            if documents:
+        for kb_id in knowledge_base_ids:
+            if kb_id in populated_kb_ids:
                 vector_store = VectorStoreFactory.create(
                     store_type=settings.VECTOR_STORE_TYPE,
-                    collection_name=f"kb_{kb.id}",
+                    collection_name=f"kb_{kb_id}",
                     embedding_function=embeddings,
                 )
                 vector_stores.append(vector_store)
         
         if not vector_stores:
             error_msg = "I don't have any knowledge base to help answer your question."
-            yield f'0:"{error_msg}"\n'
+            yield _frame("0", error_msg)
             yield 'd:{"finishReason":"stop","usage":{"promptTokens":0,"completionTokens":0}}\n'
             bot_message.content = error_msg
-            db.commit()
+            await asyncio.to_thread(db.commit)
             return
         
-        # Create a merged retriever that queries ALL documents in ALL vector stores
-        if len(vector_stores) == 1:
-            # Single vector store - use directly
-            retriever = vector_stores[0].as_retriever(
-                search_kwargs={"k": settings.TOP_K_RETRIEVAL}
-            )
-        else:
-            # Multiple vector stores - use ensemble retriever to query all
-            from langchain.retrievers import EnsembleRetriever
-            retrievers = [vs.as_retriever(search_kwargs={"k": settings.TOP_K_RETRIEVAL // len(vector_stores)}) for vs in vector_stores]
-            retriever = EnsembleRetriever(
-                retrievers=retrievers,
-                weights=[1.0 / len(retrievers)] * len(retrievers)
-            )
-        
         # Initialize LLM
         llm = LLMFactory.create()
         
-        # Create contextualize question prompt
-        contextualize_q_system_prompt = (
-            "Given a chat history and the latest user question "
-            "which might reference context in the chat history, "
-            "formulate a standalone question which can be understood "
-            "without the chat history. Do NOT answer the question, just "
-            "reformulate it if needed and otherwise return it as is."
-        )
-        contextualize_q_prompt = ChatPromptTemplate.from_messages([
-            ("system", contextualize_q_system_prompt),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ])
-        
-        # Create history aware retriever
-        history_aware_retriever = create_history_aware_retriever(
-            llm, 
-            retriever,
-            contextualize_q_prompt
-        )
-
-        # Enhanced QA prompt with Fortes Education branding
-        qa_system_prompt = (
-            "You are Fortes Education Assistant, an expert Q&A system powered by RAG technology. "
-            "You will be given a user question and a set of related contexts to answer it. "
-            "Each context has an implicit reference number based on its position (first context is 1, second is 2, etc.). "
-            "Please provide a clean, concise, and accurate answer using these contexts. "
-            "IMPORTANT: Cite your sources using the format [citation:x] at the end of each sentence where applicable. "
-            "If a sentence draws from multiple contexts, list all citations, like [citation:1][citation:2]. "
-            "If the contexts don't provide sufficient information, say 'I don't have enough information about' followed by the topic. "
-            "Limit your answer to 1024 tokens. Be professional, unbiased, and concise.\n\n"
-            "Context: {context}\n\n"
-        )
-        qa_prompt = ChatPromptTemplate.from_messages([
-            ("system", qa_system_prompt),
-            MessagesPlaceholder("chat_history"),
-            ("human", "{input}")
-        ])
-
-        document_prompt = PromptTemplate.from_template("\n\n- {page_content}\n\n")
-
         # Create QA chain
         question_answer_chain = create_stuff_documents_chain(
             llm,
-            qa_prompt,
+            _QA_PROMPT,
             document_variable_name="context",
-            document_prompt=document_prompt
+            document_prompt=_DOC_PROMPT
         )
 
-        # Create retrieval chain
+        # Prepare chat history; assistant turns keep only the answer after the
+        # context separator (the whole content when there is none)
+        chat_history = [
+            HumanMessage(content=message["content"]) if message["role"] == "user"
+            else AIMessage(content=message["content"].rpartition("__LLM_RESPONSE__")[2])
+            for message in messages["messages"]
+            if message["role"] in ("user", "assistant")
+        ]
+
+        # Resolve the standalone retrieval query. With history, the raw query
+        # is embedded while the LLM rewrites it, and that vector is kept
+        # whenever the rewrite leaves the query unchanged.
+        retrieval_query = processed_query
+        query_embedding = cache_embedding
+        if chat_history:
+            contextualize_chain = _CONTEXTUALIZE_PROMPT | llm | StrOutputParser()
+            pending = [contextualize_chain.ainvoke({
+                "input": processed_query,
+                "chat_history": chat_history
+            })]
+            if query_embedding is None:
+                pending.append(asyncio.to_thread(embeddings.embed_query, processed_query))
+            retrieval_query, *embedded = await asyncio.gather(*pending)
+            if embedded:
+                query_embedding = embedded[0]
+            if retrieval_query != processed_query:
+                query_embedding = None
+
+        # Retrieve context from ALL vector stores concurrently by the query
+        # vector, fusing the per-store rankings when there are several
+        if query_embedding is None:
+            query_embedding = await asyncio.to_thread(embeddings.embed_query, retrieval_query)
+        results = await asyncio.gather(*(
+            asyncio.to_thread(
+                vs.similarity_search_by_vector_with_embeddings, query_embedding, k=settings.TOP_K_RETRIEVAL
+            )
+            for vs in vector_stores
+        ))
+        # Stored vectors of the hits, reused by attribution; keyed by page
+        # content, which is also how fusion identifies documents
+        doc_vectors = {
+            doc.page_content: vector for hits in results for doc, vector in hits
+        }
+        result_docs = [[doc for doc, _ in hits] for hits in results]
+        if len(result_docs) == 1:
+            docs = result_docs[0]
+        else:
+            docs = _reciprocal_rank_fusion(result_docs)[:settings.TOP_K_RETRIEVAL]
+
+        # Create retrieval chain over the already retrieved documents
         rag_chain = create_retrieval_chain(
-            history_aware_retriever,
+            RunnableLambda(lambda _: docs),
             question_answer_chain,
         )
 
-        # Prepare chat history
-        chat_history = []
-        for message in messages["messages"]:
-            if message["role"] == "user":
-                chat_history.append(HumanMessage(content=message["content"]))
-            elif message["role"] == "assistant":
-                if "__LLM_RESPONSE__" in message["content"]:
-                    message["content"] = message["content"].split("__LLM_RESPONSE__")[-1]
-                chat_history.append(AIMessage(content=message["content"]))
-
         # Step 4: Generate response and collect context
         full_response = ""
+        context_prefix = ""
         retrieved_chunks = []
         context_sent = False
         
@@ -219,7 +305,8 @@ async def generate_enhanced_response(
                         "line_start": context.metadata.get("line_start", 0),
                         "line_end": context.metadata.get("line_end", 0),
                         "score": context.metadata.get("score", 0.8),  # Default score
-                        "metadata": context.metadata
+                        "metadata": context.metadata,
+                        "embedding": doc_vectors.get(context.page_content)
                     }
                     retrieved_chunks.append(chunk_data)
                 
@@ -234,55 +321,50 @@ async def generate_enhanced_response(
                 
                 if not is_grounded:
                     # Return refusal for low grounding
-                    yield f'0:"{refusal_message}"\n'
+                    yield _frame("0", refusal_message)
                     yield f'd:{{"finishReason":"stop","grounding_score":{grounding_score:.3f}}}\n'
                     bot_message.content = refusal_message
-                    db.commit()
+                    await asyncio.to_thread(db.commit)
                     return
                 
                 # Serialize and send context
-                serializable_context = []
-                for context in chunk["context"]:
-                    serializable_doc = {
-                        "page_content": context.page_content.replace('"', '\\"'),
-                        "metadata": context.metadata,
-                    }
-                    serializable_context.append(serializable_doc)
+                # json.dumps does all the escaping, so content goes in as-is
+                serializable_context = [
+                    {"page_content": context.page_content, "metadata": context.metadata}
+                    for context in chunk["context"]
+                ]
                 
-                escaped_context = json.dumps({
+                context_json = json.dumps({
                     "context": serializable_context,
                     "grounding_score": round(grounding_score, 3)
                 })
 
-                base64_context = base64.b64encode(escaped_context.encode()).decode()
-                separator = "__LLM_RESPONSE__"
-                
-                yield f'0:"{base64_context}{separator}"\n'
-                full_response += base64_context + separator
+                # Raw JSON in a message annotation frame, attached to this
+                # assistant message; it is stored ahead of the separator
+                yield f'8:[{context_json}]\n'
+                context_prefix = context_json + "__LLM_RESPONSE__"
                 context_sent = True
 
             if "answer" in chunk:
                 answer_chunk = chunk["answer"]
                 full_response += answer_chunk
-                escaped_chunk = (answer_chunk
-                    .replace('"', '\\"')
-                    .replace('\n', '\\n'))
-                yield f'0:"{escaped_chunk}"\n'
+                yield _frame("0", answer_chunk)
         
-        # Step 6: Apply output guardrails (PII redaction)
-        output_result = guardrails_service.process_response(full_response)
-        final_response = output_result["processed_response"]
+        # Step 6: Apply output guardrails (PII redaction) to the answer; the
+        # stored context JSON is left intact
+        output_result = await asyncio.to_thread(guardrails_service.process_response, full_response)
+        answer_only = output_result["processed_response"]
+        final_response = context_prefix + answer_only
         
-        # Step 7: Perform sentence-level attribution
-        answer_only = final_response.split("__LLM_RESPONSE__")[-1] if "__LLM_RESPONSE__" in final_response else final_response
-        annotated_sentences, has_hallucination, attribution_stats = attribution_service.annotate_response(
+        # Step 7: Perform sentence-level attribution. Stub vectors carry no
+        # meaning, so stub mode scores by word overlap instead.
+        attribution_data, has_hallucination, attribution_stats = await asyncio.to_thread(
+            attribution_service.annotate_response_for_api,
             answer_only,
-            retrieved_chunks
+            retrieved_chunks,
+            embeddings=None if is_stub_embeddings(embeddings) else embeddings
         )
         
-        # Format attribution for response
-        attribution_data = attribution_service.format_citations_for_response(annotated_sentences)
-        
         # Step 8: Log generation metrics
         observability_service.log_generation_request(
             prompt=processed_query,
@@ -312,26 +394,27 @@ async def generate_enhanced_response(
         
         # Update bot message
         bot_message.content = final_response
-        db.commit()
+        await asyncio.to_thread(db.commit)
         
         # Cache the response
         observability_service.cache_response(
-            query,
+            query_key,
             corpus_id,
             {
                 "response": final_response,
                 "metadata": final_metadata
-            }
+            },
+            query_embedding=cache_embedding
         )
             
     except Exception as e:
         error_message = f"Error generating response: {str(e)}"
         logger.error(error_message, exc_info=True)
-        yield f'3:"{error_message}"\n'
+        yield _frame("3", error_message)
         
         if 'bot_message' in locals():
             bot_message.content = error_message
-            db.commit()
+            await asyncio.to_thread(db.commit)
     finally:
         db.close()
 
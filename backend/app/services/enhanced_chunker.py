@@ -3,16 +3,19 @@ Enhanced Chunking Service for Fortes Education
 Implements chunking with doc_id and line number tracking for citations
 """
 
+import re
 import logging
-from typing import List, Dict, Any, Optional
+from itertools import accumulate
+from typing import Iterable, List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
-import hashlib
+import numpy as np
+import xxhash
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class DocumentChunk:
     """Represents a chunk with full citation metadata"""
     doc_id: str
@@ -25,6 +28,36 @@ class DocumentChunk:
     metadata: Dict[str, Any]
 
 
+@dataclass(slots=True)
+class ChunkBatch:
+    """
+    The chunks of one document as parallel columns
+
+    Bulk consumers (embedding, vector store and DB inserts) read one column,
+    e.g. ``embed_documents(batch.contents)``, without touching the others.
+    """
+    doc_id: str
+    chunk_ids: List[str]
+    contents: List[str]
+    line_starts: np.ndarray
+    line_ends: np.ndarray
+    char_starts: np.ndarray
+    char_ends: np.ndarray
+    word_counts: np.ndarray
+    metadata: Dict[str, Any]  # Document-level metadata shared by every chunk
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def chunk_metadata(self, chunk_index: int) -> Dict[str, Any]:
+        """Metadata of a single chunk"""
+        return {
+            **self.metadata,
+            "chunk_index": chunk_index,
+            "word_count": int(self.word_counts[chunk_index])
+        }
+
+
 class EnhancedChunker:
     """Enhanced text chunker with citation tracking"""
 
@@ -35,11 +68,12 @@ class EnhancedChunker:
     ):
         self.chunk_size = chunk_size or settings.CHUNK_SIZE
         self.chunk_overlap = chunk_overlap or settings.CHUNK_OVERLAP
+        self.word_pattern = re.compile(r'\S+')
 
     def _generate_doc_id(self, filename: str, content: str) -> str:
         """Generate a unique document ID"""
-        # Use filename + content hash for uniqueness
-        content_hash = hashlib.md5(content.encode()).hexdigest()[:8]
+        # Use filename + content hash for uniqueness (non-cryptographic, only dedup)
+        content_hash = xxhash.xxh3_64_hexdigest(content.encode())[:8]
         clean_filename = filename.replace(" ", "_").replace("/", "_")
         return f"{clean_filename}_{content_hash}"
 
@@ -47,9 +81,94 @@ class EnhancedChunker:
         """Generate a unique chunk ID"""
         return f"{doc_id}_chunk_{chunk_index}"
 
-    def _count_lines_up_to(self, text: str, position: int) -> int:
-        """Count number of lines up to a given character position"""
-        return text[:position].count('\n') + 1
+    def _newline_offsets(self, text: str) -> List[int]:
+        """Sorted character offsets of every newline in text"""
+        return [match.start() for match in re.finditer('\n', text)]
+
+    def _chunk_bounds(
+        self,
+        word_spans: np.ndarray,
+        newline_offsets: List[int]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Word windows and citation bounds for every chunk at once
+
+        Args:
+            word_spans: (words, 2) array of each word's character start/end
+            newline_offsets: Sorted newline character offsets
+
+        Returns:
+            Parallel arrays (word_start, word_end, char_start, char_end, line_start, line_end)
+        """
+        word_starts = np.arange(0, len(word_spans), self.chunk_size - self.chunk_overlap)
+        word_ends = np.minimum(word_starts + self.chunk_size, len(word_spans))
+
+        char_starts = word_spans[word_starts, 0]
+        char_ends = word_spans[word_ends - 1, 1]
+
+        # A position's line is 1 + the number of newlines before it
+        line_starts = np.searchsorted(newline_offsets, char_starts) + 1
+        line_ends = np.searchsorted(newline_offsets, char_ends) + 1
+
+        return word_starts, word_ends, char_starts, char_ends, line_starts, line_ends
+
+    def chunk_text_soa(
+        self,
+        text: str,
+        filename: str,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> ChunkBatch:
+        """
+        Chunk text into overlapping segments with line tracking, as parallel columns
+
+        Args:
+            text: The text to chunk
+            filename: Original filename for doc_id generation
+            metadata: Additional metadata to attach to chunks
+
+        Returns:
+            ChunkBatch with one entry per chunk in every column
+        """
+        doc_id = self._generate_doc_id(filename, text)
+        chunk_metadata = metadata or {}
+        chunk_metadata["filename"] = filename
+        chunk_metadata["doc_length"] = len(text)
+
+        if not text.strip():
+            logger.warning(f"Empty text provided for chunking: {filename}")
+            spans = []
+        else:
+            # Split into words for token approximation, keeping each word's
+            # character span so chunk offsets need no searching
+            spans = [match.span() for match in self.word_pattern.finditer(text)]
+
+        word_starts, word_ends, char_starts, char_ends, line_starts, line_ends = self._chunk_bounds(
+            np.array(spans, dtype=np.int64).reshape(-1, 2),
+            self._newline_offsets(text)
+        )
+
+        batch = ChunkBatch(
+            doc_id=doc_id,
+            chunk_ids=[self._generate_chunk_id(doc_id, i) for i in range(len(word_starts))],
+            contents=[
+                " ".join(text[start:end] for start, end in spans[word_start:word_end])
+                for word_start, word_end in zip(word_starts.tolist(), word_ends.tolist())
+            ],
+            line_starts=line_starts,
+            line_ends=line_ends,
+            char_starts=char_starts,
+            char_ends=char_ends,
+            word_counts=word_ends - word_starts,
+            metadata=chunk_metadata
+        )
+
+        if spans:
+            logger.info(
+                f"Chunked '{filename}' into {len(batch)} chunks "
+                f"(size={self.chunk_size}, overlap={self.chunk_overlap})"
+            )
+
+        return batch
 
     def chunk_text(
         self,
@@ -68,72 +187,46 @@ class EnhancedChunker:
         Returns:
             List of DocumentChunk objects with citation metadata
         """
-        if not text.strip():
-            logger.warning(f"Empty text provided for chunking: {filename}")
-            return []
-
-        doc_id = self._generate_doc_id(filename, text)
-        chunks = []
-        chunk_metadata = metadata or {}
-        chunk_metadata["filename"] = filename
-        chunk_metadata["doc_length"] = len(text)
+        batch = self.chunk_text_soa(text, filename, metadata)
 
-        # Split into words for token approximation
-        words = text.split()
-        current_pos = 0
-        chunk_index = 0
-
-        while current_pos < len(words):
-            # Get chunk window
-            chunk_end = min(current_pos + self.chunk_size, len(words))
-            chunk_words = words[current_pos:chunk_end]
-            chunk_text = " ".join(chunk_words)
-
-            # Find character positions in original text
-            # This is approximate but good enough for line tracking
-            char_start = text.find(chunk_words[0], 0 if chunk_index == 0 else chunks[-1].char_start)
-            if char_start == -1:
-                char_start = 0
-            
-            # Find end of last word in chunk
-            if chunk_end < len(words):
-                # Find the end of the last word in this chunk
-                last_word = chunk_words[-1]
-                char_end = text.find(last_word, char_start) + len(last_word)
-            else:
-                char_end = len(text)
-
-            # Calculate line numbers
-            line_start = self._count_lines_up_to(text, char_start)
-            line_end = self._count_lines_up_to(text, char_end)
-
-            # Create chunk
-            chunk = DocumentChunk(
-                doc_id=doc_id,
-                chunk_id=self._generate_chunk_id(doc_id, chunk_index),
-                content=chunk_text,
+        return [
+            DocumentChunk(
+                doc_id=batch.doc_id,
+                chunk_id=chunk_id,
+                content=content,
                 line_start=line_start,
                 line_end=line_end,
                 char_start=char_start,
                 char_end=char_end,
-                metadata={
-                    **chunk_metadata,
-                    "chunk_index": chunk_index,
-                    "word_count": len(chunk_words)
-                }
+                metadata=batch.chunk_metadata(chunk_index)
             )
-            chunks.append(chunk)
-
-            # Move to next chunk with overlap
-            current_pos += (self.chunk_size - self.chunk_overlap)
-            chunk_index += 1
+            for chunk_index, (chunk_id, content, line_start, line_end, char_start, char_end) in enumerate(zip(
+                batch.chunk_ids,
+                batch.contents,
+                batch.line_starts.tolist(),
+                batch.line_ends.tolist(),
+                batch.char_starts.tolist(),
+                batch.char_ends.tolist()
+            ))
+        ]
 
-        logger.info(
-            f"Chunked '{filename}' into {len(chunks)} chunks "
-            f"(size={self.chunk_size}, overlap={self.chunk_overlap})"
-        )
+    def chunk_batch(
+        self,
+        documents: Iterable[Tuple[str, str]],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> List[DocumentChunk]:
+        """
+        Chunk several (text, filename) documents into one flat list
 
-        return chunks
+        Chunking is pure Python and holds the GIL, so documents are processed
+        in order rather than on a thread pool. Each document gets its own copy
+        of metadata, since chunking records the filename in it.
+        """
+        return [
+            chunk
+            for text, filename in documents
+            for chunk in self.chunk_text(text, filename, dict(metadata or {}))
+        ]
 
     def chunk_document(
         self,
@@ -148,23 +241,31 @@ class EnhancedChunker:
         Returns:
             List of chunk dictionaries ready for vector store
         """
-        chunks = self.chunk_text(content, filename, metadata)
-        
+        batch = self.chunk_text_soa(content, filename, metadata)
+
+        # Columns stay SoA until this storage boundary
         return [
             {
-                "doc_id": chunk.doc_id,
-                "chunk_id": chunk.chunk_id,
-                "content": chunk.content,
-                "line_start": chunk.line_start,
-                "line_end": chunk.line_end,
-                "char_start": chunk.char_start,
-                "char_end": chunk.char_end,
+                "doc_id": batch.doc_id,
+                "chunk_id": chunk_id,
+                "content": chunk_content,
+                "line_start": line_start,
+                "line_end": line_end,
+                "char_start": char_start,
+                "char_end": char_end,
                 "metadata": {
-                    **chunk.metadata,
+                    **batch.chunk_metadata(chunk_index),
                     "doc_type": doc_type
                 }
             }
-            for chunk in chunks
+            for chunk_index, (chunk_id, chunk_content, line_start, line_end, char_start, char_end) in enumerate(zip(
+                batch.chunk_ids,
+                batch.contents,
+                batch.line_starts.tolist(),
+                batch.line_ends.tolist(),
+                batch.char_starts.tolist(),
+                batch.char_ends.tolist()
+            ))
         ]
 
     def chunk_by_lines(
@@ -186,6 +287,9 @@ class EnhancedChunker:
         chunk_metadata = metadata or {}
         chunk_metadata["filename"] = filename
 
+        # Character offset of the start of each line (+1 for \n)
+        line_offsets = list(accumulate((len(line) + 1 for line in lines), initial=0))
+
         current_line = 0
         while current_line < len(lines):
             chunk_end_line = min(current_line + lines_per_chunk, len(lines))
@@ -193,7 +297,7 @@ class EnhancedChunker:
             chunk_text = '\n'.join(chunk_lines)
 
             # Calculate character positions
-            char_start = sum(len(line) + 1 for line in lines[:current_line])  # +1 for \n
+            char_start = line_offsets[current_line]
             char_end = char_start + len(chunk_text)
 
             chunk = DocumentChunk(
@@ -31,15 +31,23 @@ class GuardrailsService:
         r"<\|.*?\|>",
     ]
 
+    # Literal substrings, at least one of which every injection pattern needs
+    # to match. Text without any of them skips the full regex entirely.
+    INJECTION_ANCHORS = (
+        "ignore", "disregard", "forget", "now", "system", "jailbreak",
+        "sudo", "developer", "admin", "root", "inst]", "<|",
+    )
+
     # PII patterns
     EMAIL_PATTERN = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b"
     
-    # Phone patterns (including UAE format)
+    # Phone patterns (including UAE format), most specific first so the
+    # combined alternation prefers them over the general pattern
     PHONE_PATTERNS = [
-        r"\+?\d{1,3}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}",  # General international
-        r"\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b",  # US format
         r"\+971[-.\s]?\d{1,2}[-.\s]?\d{3}[-.\s]?\d{4}",  # UAE format
         r"\b05\d[-.\s]?\d{3}[-.\s]?\d{4}\b",  # UAE local format
+        r"\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b",  # US format
+        r"\+?\d{1,3}[-.\s]?\(?\d{1,4}\)?[-.\s]?\d{1,4}[-.\s]?\d{1,9}",  # General international
     ]
 
     def __init__(self):
@@ -47,8 +55,20 @@ class GuardrailsService:
             "|".join(self.INJECTION_PATTERNS), 
             re.IGNORECASE
         )
-        self.email_regex = re.compile(self.EMAIL_PATTERN)
-        self.phone_regexes = [re.compile(pattern) for pattern in self.PHONE_PATTERNS]
+        # Anchors are matched with the same IGNORECASE rules as the full
+        # regex (e.g. dotless "ı" matches "i"), so the prefilter never
+        # rejects text the patterns would flag
+        self.injection_prefilter_regex = re.compile(
+            "|".join(re.escape(anchor) for anchor in self.INJECTION_ANCHORS),
+            re.IGNORECASE
+        )
+        # Every PII pattern needs an "@" or a digit; text with neither is clean
+        self.pii_prefilter_regex = re.compile(r"[@\d]")
+        # All PII patterns in one alternation so text is scanned once; emails
+        # come first so their digits are never picked up as phone numbers
+        self.pii_regex = re.compile(
+            f"(?P<email>{self.EMAIL_PATTERN})|(?P<phone>{'|'.join(self.PHONE_PATTERNS)})"
+        )
 
     def detect_prompt_injection(self, text: str) -> Tuple[bool, str]:
         """
@@ -60,6 +80,10 @@ class GuardrailsService:
         if not settings.ENABLE_PROMPT_INJECTION_DETECTION:
             return False, ""
 
+        # Cheap literal prefilter before the full pattern alternation
+        if not self.injection_prefilter_regex.search(text):
+            return False, ""
+
         match = self.injection_regex.search(text)
         if match:
             reason = f"Potential prompt injection detected: '{match.group()}'"
@@ -78,23 +102,17 @@ class GuardrailsService:
         if not settings.ENABLE_PII_REDACTION:
             return text, []
 
+        if not self.pii_prefilter_regex.search(text):
+            return text, []
+
         redacted_items = []
-        redacted_text = text
-
-        # Redact emails
-        emails = self.email_regex.findall(redacted_text)
-        for email in emails:
-            redacted_text = redacted_text.replace(email, "[EMAIL_REDACTED]")
-            redacted_items.append(f"email:{email}")
-
-        # Redact phone numbers
-        for phone_regex in self.phone_regexes:
-            phones = phone_regex.findall(redacted_text)
-            for phone in phones:
-                # Avoid re-redacting already redacted items
-                if "[PHONE_REDACTED]" not in phone and "[EMAIL_REDACTED]" not in phone:
-                    redacted_text = redacted_text.replace(phone, "[PHONE_REDACTED]")
-                    redacted_items.append(f"phone:{phone}")
+
+        def _redact(match: re.Match) -> str:
+            kind = match.lastgroup
+            redacted_items.append(f"{kind}:{match.group()}")
+            return f"[{kind.upper()}_REDACTED]"
+
+        redacted_text = self.pii_regex.sub(_redact, text)
 
         if redacted_items:
             logger.info(f"Redacted {len(redacted_items)} PII items")
@@ -1,5 +1,8 @@
 import logging
+from functools import lru_cache
 from typing import Optional
+
+import httpx
 from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI
 from langchain_deepseek import ChatDeepSeek
@@ -18,45 +21,84 @@ class LLMFactory:
     ) -> BaseChatModel:
         """
         Create a LLM instance with automatic fallback to stub when API key unavailable
-        """
-        provider = provider or settings.CHAT_PROVIDER
 
+        Instances are shared per (provider, model, temperature, streaming) so
+        requests reuse one client and its HTTP connection pool. The chat models
+        keep no per-call state, so one instance is safe across concurrent
+        requests; callers must not mutate it and should use bind()/with_config()
+        for per-request options, which return new runnables. A failed
+        initialization is not cached: the stub serves this call only and the
+        next call retries the real provider.
+        """
+        provider = (provider or settings.CHAT_PROVIDER).lower()
         try:
-            if provider.lower() == "openai":
-                # Check if API key is configured
-                if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "your-openai-api-key-here":
-                    logger.warning("⚠️  No valid OpenAI API key found. Falling back to stub LLM.")
-                    from app.services.stub_services import create_stub_llm
-                    return create_stub_llm()
-                
-                logger.info(f"✓ Using OpenAI LLM: {settings.OPENAI_MODEL}")
-                return ChatOpenAI(
-                    temperature=temperature,
-                    streaming=streaming,
-                    model=settings.OPENAI_MODEL,
-                    openai_api_key=settings.OPENAI_API_KEY,
-                    openai_api_base=settings.OPENAI_API_BASE
-                )
-            elif provider.lower() == "deepseek":
-                return ChatDeepSeek(
-                    temperature=temperature,
-                    streaming=streaming,
-                    model=settings.DEEPSEEK_MODEL,
-                    api_key=settings.DEEPSEEK_API_KEY,
-                    api_base=settings.DEEPSEEK_API_BASE
-                )
-            elif provider.lower() == "ollama":
-                return OllamaLLM(
-                    model=settings.OLLAMA_MODEL,
-                    base_url=settings.OLLAMA_API_BASE,
-                    temperature=temperature,
-                    streaming=streaming
-                )
-            else:
-                raise ValueError(f"Unsupported LLM provider: {provider}")
-        
+            return LLMFactory._create_cached(
+                provider, LLMFactory._model_for(provider), temperature, streaming
+            )
         except Exception as e:
             logger.error(f"Failed to initialize {provider} LLM: {e}")
             logger.warning("Falling back to stub LLM for development/testing")
             from app.services.stub_services import create_stub_llm
-            return create_stub_llm()
\ No newline at end of file
+            return create_stub_llm()
+
+    @staticmethod
+    def _model_for(provider: str) -> Optional[str]:
+        """Configured model name for a provider"""
+        return {
+            "openai": settings.OPENAI_MODEL,
+            "deepseek": settings.DEEPSEEK_MODEL,
+            "ollama": settings.OLLAMA_MODEL,
+        }.get(provider)
+
+    @staticmethod
+    def _http_clients() -> dict:
+        """Pooled sync and async HTTP clients for OpenAI-compatible providers"""
+        limits = httpx.Limits(max_keepalive_connections=20, max_connections=40)
+        return {
+            "http_client": httpx.Client(limits=limits),
+            "http_async_client": httpx.AsyncClient(limits=limits),
+        }
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _create_cached(
+        provider: str,
+        model: Optional[str],
+        temperature: float,
+        streaming: bool
+    ) -> BaseChatModel:
+        # lru_cache does not cache exceptions, so a failed init is retried
+        if provider == "openai":
+            # Check if API key is configured
+            if not settings.OPENAI_API_KEY or settings.OPENAI_API_KEY == "your-openai-api-key-here":
+                logger.warning("⚠️  No valid OpenAI API key found. Falling back to stub LLM.")
+                from app.services.stub_services import create_stub_llm
+                return create_stub_llm()
+
+            logger.info(f"✓ Using OpenAI LLM: {model}")
+            return ChatOpenAI(
+                temperature=temperature,
+                streaming=streaming,
+                model=model,
+                openai_api_key=settings.OPENAI_API_KEY,
+                openai_api_base=settings.OPENAI_API_BASE,
+                **LLMFactory._http_clients()
+            )
+        elif provider == "deepseek":
+            return ChatDeepSeek(
+                temperature=temperature,
+                streaming=streaming,
+                model=model,
+                api_key=settings.DEEPSEEK_API_KEY,
+                api_base=settings.DEEPSEEK_API_BASE,
+                **LLMFactory._http_clients()
+            )
+        elif provider == "ollama":
+            return OllamaLLM(
+                model=model,
+                base_url=settings.OLLAMA_API_BASE,
+                temperature=temperature,
+                streaming=streaming
+            )
+        else:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
@@ -3,19 +3,57 @@ Observability Service for Fortes Education
 Implements token logging, cost tracking, and prompt caching
 """
 
+import heapq
 import logging
-import hashlib
+import pickle
+import sys
 import time
-from typing import Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Optional, Set, Tuple
+import numpy as np
+import xxhash
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Returned by log_request when there is no entry to report
+_EMPTY_LOG_ENTRY: Mapping[str, Any] = MappingProxyType({})
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    """Tokenizer for the configured chat model, or None when tiktoken is unavailable"""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken not installed, estimating tokens as ~4 chars each")
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+    except KeyError:
+        pass  # Model unknown to tiktoken; fall back to the GPT-4 family encoding
+    except Exception as e:
+        logger.warning(f"Failed to load tiktoken encoding: {e}, estimating tokens as ~4 chars each")
+        return None
+
+    # Separate try so a failed fallback (e.g. offline download) is cached as
+    # None instead of raising on every token count
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Failed to load tiktoken encoding: {e}, estimating tokens as ~4 chars each")
+        return None
+
 
 class TokenCostTracker:
     """Track token usage and estimated costs"""
 
+    TOKEN_COUNT_CACHE_SIZE = 4096
+
     # Pricing per 1M tokens (as of 2024)
     PRICING = {
         "gpt-4o-mini": {
@@ -44,21 +82,50 @@ class TokenCostTracker:
         }
     }
 
+    # (input, output) dollars per single token, so a cost is two multiplies
+    _PRICE_PER_TOKEN = {
+        sys.intern(model): (rates["input"] / 1_000_000, rates["output"] / 1_000_000)
+        for model, rates in PRICING.items()
+    }
+    _DEFAULT_PRICING_MODEL = "gpt-4o-mini"
+
+    # Slots in the integer counter array
+    (
+        _REQUESTS,
+        _INPUT_TOKENS,
+        _OUTPUT_TOKENS,
+        _CACHE_HITS,
+        _CACHE_MISSES,
+        _SEMANTIC_CACHE_HITS,
+    ) = range(6)
+
     def __init__(self):
-        self.session_stats = {
-            "total_requests": 0,
-            "total_input_tokens": 0,
-            "total_output_tokens": 0,
-            "total_cost": 0.0,
-            "cache_hits": 0,
-            "cache_misses": 0
-        }
+        # Flat typed arrays: one indexed add per counter on the request path,
+        # with the stats dict only built when someone reads it
+        self._counters = array("q", [0] * 6)
+        self._cost = array("d", [0.0])
+        # Token counts by text fingerprint; repeated prompts skip re-encoding
+        self._token_counts: OrderedDict[int, int] = OrderedDict()
+        self._unknown_models: Set[str] = set()
 
     def estimate_tokens(self, text: str) -> int:
         """
-        Estimate token count (rough approximation: ~4 chars per token)
+        Count tokens with the model's tokenizer, falling back to ~4 chars per token
         """
-        return len(text) // 4
+        encoder = _get_encoder()
+        if encoder is None:
+            return len(text) // 4
+
+        fingerprint = xxhash.xxh3_64_intdigest(text.encode())
+        count = self._token_counts.get(fingerprint)
+        if count is None:
+            count = len(encoder.encode(text, disallowed_special=()))
+            self._token_counts[fingerprint] = count
+            if len(self._token_counts) > self.TOKEN_COUNT_CACHE_SIZE:
+                self._token_counts.popitem(last=False)
+        else:
+            self._token_counts.move_to_end(fingerprint)
+        return count
 
     def calculate_cost(
         self, 
@@ -69,16 +136,15 @@ class TokenCostTracker:
         """
         Calculate estimated cost for a request
         """
-        if model not in self.PRICING:
-            logger.warning(f"Unknown model for pricing: {model}, using gpt-4o-mini rates")
-            model = "gpt-4o-mini"
+        rates = self._PRICE_PER_TOKEN.get(model)
+        if rates is None:
+            # Warn once per model rather than on every request
+            if model not in self._unknown_models:
+                self._unknown_models.add(model)
+                logger.warning(f"Unknown model for pricing: {model}, using {self._DEFAULT_PRICING_MODEL} rates")
+            rates = self._PRICE_PER_TOKEN[self._DEFAULT_PRICING_MODEL]
 
-        pricing = self.PRICING[model]
-        
-        input_cost = (input_tokens / 1_000_000) * pricing["input"]
-        output_cost = (output_tokens / 1_000_000) * pricing["output"]
-        
-        return input_cost + output_cost
+        return input_tokens * rates[0] + output_tokens * rates[1]
 
     def log_request(
         self,
@@ -87,22 +153,30 @@ class TokenCostTracker:
         input_tokens: int,
         output_tokens: int = 0,
         metadata: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, Any]:
+    ) -> Mapping[str, Any]:
         """
         Log a request and return stats
+
+        Session counters always update; the per-request entry is only built
+        when cost tracking is on, otherwise a shared empty mapping is returned.
         """
         if not settings.ENABLE_TOKEN_LOGGING:
-            return {}
+            return _EMPTY_LOG_ENTRY
 
         cost = self.calculate_cost(model, input_tokens, output_tokens)
         
-        self.session_stats["total_requests"] += 1
-        self.session_stats["total_input_tokens"] += input_tokens
-        self.session_stats["total_output_tokens"] += output_tokens
-        self.session_stats["total_cost"] += cost
+        counters = self._counters
+        counters[self._REQUESTS] += 1
+        counters[self._INPUT_TOKENS] += input_tokens
+        counters[self._OUTPUT_TOKENS] += output_tokens
+        self._cost[0] += cost
+
+        if not settings.ENABLE_COST_TRACKING:
+            return _EMPTY_LOG_ENTRY
 
         log_entry = {
-            "timestamp": datetime.utcnow().isoformat(),
+            # Epoch nanoseconds; far cheaper than formatting a datetime per call
+            "timestamp": time.time_ns(),
             "request_type": request_type,
             "model": model,
             "input_tokens": input_tokens,
@@ -111,57 +185,110 @@ class TokenCostTracker:
             "metadata": metadata or {}
         }
 
-        if settings.ENABLE_COST_TRACKING:
+        if logger.isEnabledFor(logging.INFO):
             logger.info(
                 f"[{request_type}] Model: {model} | "
                 f"Tokens: {input_tokens} in / {output_tokens} out | "
                 f"Cost: ${cost:.6f} | "
-                f"Session Total: ${self.session_stats['total_cost']:.6f}"
+                f"Session Total: ${self._cost[0]:.6f}"
             )
 
         return log_entry
 
+    def record_cache_lookup(self, hit: bool):
+        """Count an exact-match prompt cache hit or miss"""
+        self._counters[self._CACHE_HITS if hit else self._CACHE_MISSES] += 1
+
+    def record_semantic_cache_hit(self):
+        """Count a semantic prompt cache hit"""
+        self._counters[self._SEMANTIC_CACHE_HITS] += 1
+
+    @property
+    def session_stats(self) -> Dict[str, Any]:
+        """Snapshot of the raw session counters"""
+        counters = self._counters
+        return {
+            "total_requests": counters[self._REQUESTS],
+            "total_input_tokens": counters[self._INPUT_TOKENS],
+            "total_output_tokens": counters[self._OUTPUT_TOKENS],
+            "total_cost": self._cost[0],
+            "cache_hits": counters[self._CACHE_HITS],
+            "cache_misses": counters[self._CACHE_MISSES],
+            "semantic_cache_hits": counters[self._SEMANTIC_CACHE_HITS]
+        }
+
     def get_session_stats(self) -> Dict[str, Any]:
         """Get cumulative session statistics"""
+        stats = self.session_stats
+        cache_lookups = stats["cache_hits"] + stats["cache_misses"]
         return {
-            **self.session_stats,
+            **stats,
             "average_cost_per_request": (
-                self.session_stats["total_cost"] / self.session_stats["total_requests"]
-                if self.session_stats["total_requests"] > 0
+                stats["total_cost"] / stats["total_requests"]
+                if stats["total_requests"] > 0
                 else 0.0
             ),
             "cache_hit_rate": (
-                self.session_stats["cache_hits"] / 
-                (self.session_stats["cache_hits"] + self.session_stats["cache_misses"])
-                if (self.session_stats["cache_hits"] + self.session_stats["cache_misses"]) > 0
+                stats["cache_hits"] / cache_lookups
+                if cache_lookups > 0
                 else 0.0
             )
         }
 
 
 class PromptCache:
-    """Simple in-memory prompt cache"""
+    """Simple in-memory prompt cache with least-recently-used eviction"""
 
-    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000):
-        self.cache: Dict[str, Tuple[Any, float]] = {}
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        max_size: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024
+    ):
+        # (corpus, query) -> (result, timestamp, nbytes), ordered from least
+        # to most recently used
+        self.cache: OrderedDict[Tuple[str, str], Tuple[Any, float, int]] = OrderedDict()
+        # Min-heap of (expires_at, key) so expired entries can be swept
+        # before they take LRU slots from live ones
+        self._expiry: List[Tuple[float, Tuple[str, str]]] = []
         self.ttl_seconds = ttl_seconds
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self._current_bytes = 0
 
-    def _generate_key(self, query: str, corpus_fingerprint: str) -> str:
+    def _generate_key(self, query: str, corpus_fingerprint: str) -> Tuple[str, str]:
         """Generate cache key from query and corpus fingerprint"""
-        combined = f"{query.lower().strip()}:{corpus_fingerprint}"
-        return hashlib.sha256(combined.encode()).hexdigest()
+        # The corpus namespaces the query, so nothing needs hashing beyond the
+        # dict's own (cached) string hashes and the fields cannot run together
+        return (corpus_fingerprint, query.lower().strip())
 
     def _is_expired(self, timestamp: float) -> bool:
         """Check if cache entry is expired"""
         return (time.time() - timestamp) > self.ttl_seconds
 
-    def _evict_oldest(self):
-        """Evict oldest entry if cache is full"""
-        if len(self.cache) >= self.max_size:
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][1])
-            del self.cache[oldest_key]
-            logger.debug(f"Evicted oldest cache entry: {oldest_key}")
+    def _estimate_size(self, result: Any) -> int:
+        """Approximate memory held by a cached result"""
+        try:
+            return len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return sys.getsizeof(result)
+
+    def _discard(self, key: Tuple[str, str]):
+        """Remove an entry and release its bytes"""
+        _, _, nbytes = self.cache.pop(key)
+        self._current_bytes -= nbytes
+
+    def _sweep_expired(self, max_pops: int = 16):
+        """Drop a bounded number of expired entries, oldest first"""
+        now = time.time()
+        for _ in range(max_pops):
+            if not self._expiry or self._expiry[0][0] >= now:
+                break
+            _, key = heapq.heappop(self._expiry)
+            entry = self.cache.get(key)
+            # Keys rewritten since this heap entry was pushed are still live
+            if entry is not None and self._is_expired(entry[1]):
+                self._discard(key)
 
     def get(
         self, 
@@ -172,16 +299,18 @@ class PromptCache:
         if not settings.ENABLE_PROMPT_CACHE:
             return None
 
+        self._sweep_expired()
         key = self._generate_key(query, corpus_fingerprint)
         
         if key in self.cache:
-            result, timestamp = self.cache[key]
+            result, timestamp, _ = self.cache[key]
             
             if not self._is_expired(timestamp):
+                self.cache.move_to_end(key)
                 logger.info(f"✓ Cache hit for query: {query[:50]}...")
                 return result
             else:
-                del self.cache[key]
+                self._discard(key)
                 logger.debug(f"Cache entry expired for query: {query[:50]}...")
         
         return None
@@ -196,15 +325,35 @@ class PromptCache:
         if not settings.ENABLE_PROMPT_CACHE:
             return
 
-        self._evict_oldest()
-        
+        self._sweep_expired()
         key = self._generate_key(query, corpus_fingerprint)
-        self.cache[key] = (result, time.time())
+        nbytes = self._estimate_size(result)
+        if nbytes > self.max_bytes:
+            logger.debug(f"Result too large to cache ({nbytes} bytes) for query: {query[:50]}...")
+            return
+
+        if key in self.cache:
+            self._discard(key)
+        # Evict least recently used entries until both the count and byte budgets fit
+        while self.cache and (
+            len(self.cache) >= self.max_size
+            or self._current_bytes + nbytes > self.max_bytes
+        ):
+            evicted_key, (_, _, evicted_bytes) = self.cache.popitem(last=False)
+            self._current_bytes -= evicted_bytes
+            logger.debug(f"Evicted least recently used cache entry: {evicted_key}")
+
+        now = time.time()
+        self.cache[key] = (result, now, nbytes)
+        self._current_bytes += nbytes
+        heapq.heappush(self._expiry, (now + self.ttl_seconds, key))
         logger.debug(f"Cached result for query: {query[:50]}...")
 
     def clear(self):
         """Clear all cache entries"""
         self.cache.clear()
+        self._expiry.clear()
+        self._current_bytes = 0
         logger.info("Prompt cache cleared")
 
     def get_stats(self) -> Dict[str, Any]:
@@ -212,22 +361,161 @@ class PromptCache:
         return {
             "size": len(self.cache),
             "max_size": self.max_size,
+            "bytes_used": self._current_bytes,
+            "max_bytes": self.max_bytes,
             "ttl_seconds": self.ttl_seconds
         }
 
 
+class _SemanticCorpusEntries:
+    """
+    Ring buffer of one corpus's semantic cache entries
+
+    Row i of vectors, results and timestamps describe the same entry. Rows
+    [0, size) are filled; once full, next_row cycles over the oldest entry.
+    Capacity doubles up to max_size, so inserts never copy the whole matrix
+    once the buffer is full.
+    """
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, dim: int, max_size: int):
+        self.max_size = max_size
+        capacity = min(self.INITIAL_CAPACITY, max_size)
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.timestamps = np.full(capacity, -np.inf)
+        self.results: List[Any] = [None] * capacity
+        self.size = 0
+        self.next_row = 0
+
+    def _grow(self):
+        capacity = min(len(self.results) * 2, self.max_size)
+        extra = capacity - len(self.results)
+        self.vectors = np.concatenate([self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)])
+        self.timestamps = np.concatenate([self.timestamps, np.full(extra, -np.inf)])
+        self.results.extend([None] * extra)
+
+    def add(self, vector: np.ndarray, result: Any, timestamp: float):
+        row = self.next_row
+        if row == len(self.results):
+            self._grow()
+        self.vectors[row] = vector
+        self.timestamps[row] = timestamp
+        self.results[row] = result
+        self.size = max(self.size, row + 1)
+        self.next_row = (row + 1) % self.max_size
+
+
+class SemanticPromptCache:
+    """
+    In-memory response cache matched by query embedding
+
+    Reworded questions ("What is X?" / "What's X") miss the exact-match
+    PromptCache but embed almost identically, so a cached response is reused
+    when cosine similarity to a cached query meets the threshold.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        ttl_seconds: int = 3600,
+        max_size: int = 1000
+    ):
+        self.similarity_threshold = (
+            similarity_threshold if similarity_threshold is not None
+            else settings.SEMANTIC_CACHE_THRESHOLD
+        )
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # Per corpus: unit-normalized query embeddings with their results
+        self.cache: Dict[str, _SemanticCorpusEntries] = {}
+
+    def _normalize(self, embedding: List[float]) -> Optional[np.ndarray]:
+        """Unit-normalize an embedding, or None for a zero vector"""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def get(
+        self,
+        query_embedding: List[float],
+        corpus_fingerprint: str
+    ) -> Optional[Any]:
+        """Get the cached result for the most similar unexpired query, if close enough"""
+        if not settings.ENABLE_PROMPT_CACHE or corpus_fingerprint not in self.cache:
+            return None
+
+        query_vector = self._normalize(query_embedding)
+        if query_vector is None:
+            return None
+
+        entries = self.cache[corpus_fingerprint]
+        if query_vector.shape[0] != entries.vectors.shape[1]:
+            return None
+
+        # Expired rows are masked out before picking the best match, so a
+        # stale nearest entry cannot hide a fresh one above the threshold
+        size = entries.size
+        live = entries.timestamps[:size] >= time.time() - self.ttl_seconds
+        if not live.any():
+            return None
+        similarities = np.where(live, entries.vectors[:size] @ query_vector, -np.inf)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+
+        logger.info(f"✓ Semantic cache hit (similarity {similarities[best]:.3f})")
+        return entries.results[best]
+
+    def set(
+        self,
+        query_embedding: List[float],
+        corpus_fingerprint: str,
+        result: Any
+    ):
+        """Store result in cache"""
+        if not settings.ENABLE_PROMPT_CACHE:
+            return
+
+        query_vector = self._normalize(query_embedding)
+        if query_vector is None:
+            return
+
+        entries = self.cache.get(corpus_fingerprint)
+        # A new embedding dimension (e.g. a model change) starts the corpus over
+        if entries is None or entries.vectors.shape[1] != query_vector.shape[0]:
+            entries = _SemanticCorpusEntries(query_vector.shape[0], self.max_size)
+            self.cache[corpus_fingerprint] = entries
+
+        entries.add(query_vector, result, time.time())
+
+    def clear(self):
+        """Clear all cache entries"""
+        self.cache.clear()
+        logger.info("Semantic prompt cache cleared")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        return {
+            "size": sum(entries.size for entries in self.cache.values()),
+            "corpora": len(self.cache),
+            "similarity_threshold": self.similarity_threshold
+        }
+
+
 class ObservabilityService:
     """Main observability service combining all tracking"""
 
     def __init__(self):
         self.token_tracker = TokenCostTracker()
-        self.prompt_cache = PromptCache()
+        self.prompt_cache = PromptCache(max_size=10000)
+        self.semantic_cache = SemanticPromptCache()
 
     def log_embedding_request(
         self, 
         text: str, 
         model: str
-    ) -> Dict[str, Any]:
+    ) -> Mapping[str, Any]:
         """Log an embedding request"""
         tokens = self.token_tracker.estimate_tokens(text)
         return self.token_tracker.log_request(
@@ -244,7 +532,7 @@ class ObservabilityService:
         response: str,
         model: str,
         metadata: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, Any]:
+    ) -> Mapping[str, Any]:
         """Log a generation request"""
         input_tokens = self.token_tracker.estimate_tokens(prompt)
         output_tokens = self.token_tracker.estimate_tokens(response)
@@ -264,26 +552,38 @@ class ObservabilityService:
     ) -> Optional[Dict[str, Any]]:
         """Try to get cached response"""
         cached = self.prompt_cache.get(query, corpus_id)
+        self.token_tracker.record_cache_lookup(bool(cached))
+        return cached
+
+    def get_similar_cached_response(
+        self,
+        query_embedding: List[float],
+        corpus_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Try to get a cached response for a semantically equivalent query"""
+        cached = self.semantic_cache.get(query_embedding, corpus_id)
         if cached:
-            self.token_tracker.session_stats["cache_hits"] += 1
-        else:
-            self.token_tracker.session_stats["cache_misses"] += 1
+            self.token_tracker.record_semantic_cache_hit()
         return cached
 
     def cache_response(
         self, 
         query: str, 
         corpus_id: str, 
-        response: Dict[str, Any]
+        response: Dict[str, Any],
+        query_embedding: Optional[List[float]] = None
     ):
-        """Cache a response"""
+        """Cache a response, also by query embedding when one is given"""
         self.prompt_cache.set(query, corpus_id, response)
+        if query_embedding is not None:
+            self.semantic_cache.set(query_embedding, corpus_id, response)
 
     def get_stats(self) -> Dict[str, Any]:
         """Get all observability stats"""
         return {
             "token_stats": self.token_tracker.get_session_stats(),
-            "cache_stats": self.prompt_cache.get_stats()
+            "cache_stats": self.prompt_cache.get_stats(),
+            "semantic_cache_stats": self.semantic_cache.get_stats()
         }
 
 
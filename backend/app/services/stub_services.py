@@ -3,8 +3,10 @@ Stub/Fallback Services for Fortes Education
 Provides deterministic local implementations when API keys are unavailable
 """
 
+import re
 import logging
 import hashlib
+from functools import cache
 import numpy as np
 from typing import List, Any, Optional
 from langchain_core.embeddings import Embeddings
@@ -15,11 +17,17 @@ from pydantic import Field
 
 logger = logging.getLogger(__name__)
 
+# Prompt classification for StubLLM, matched in place without lowercasing copies
+_CONTEXT_RE = re.compile(r"[Cc]ontext:")
+_QUESTION_RE = re.compile(r"question|answer", re.IGNORECASE)
+
 
 class StubEmbeddings(Embeddings):
     """
     Deterministic stub embeddings for development/testing when OpenAI key is unavailable
     Uses simple text hashing to create consistent embeddings
+
+    Vectors are unit length, so cosine similarity between them is a plain dot product.
     """
     
     dimension: int = Field(default=1536, description="Embedding dimension")
@@ -33,30 +41,41 @@ class StubEmbeddings(Embeddings):
             "Set OPENAI_API_KEY for production use."
         )
     
-    def _create_embedding(self, text: str) -> List[float]:
+    def _seed(self, text: str) -> int:
+        """Derive a reproducible RNG seed from the text"""
+        # 64 bits keeps distinct texts from sharing a seed (and so a vector)
+        # well past the ~65k texts where 32-bit seeds start to collide
+        return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), byteorder='little')
+
+    def _embedding_matrix(self, texts: List[str]) -> np.ndarray:
         """
-        Create a deterministic embedding from text using hashing
+        Create deterministic unit-length embeddings, one row per text
         """
-        # Create a hash of the text
-        text_hash = hashlib.sha256(text.encode()).digest()
-        
-        # Use the hash to seed a random number generator for reproducibility
-        seed = int.from_bytes(text_hash[:4], byteorder='big')
-        rng = np.random.RandomState(seed)
+        # float32 carries all the precision these vectors have at half the bytes
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
         
-        # Generate a random but deterministic vector
-        embedding = rng.randn(self.dimension)
+        # Each row comes from an RNG seeded by its text, so a text always
+        # gets the same vector regardless of the batch it arrives in
+        for row, text in enumerate(texts):
+            embeddings[row] = np.random.default_rng(self._seed(text)).standard_normal(
+                self.dimension, dtype=np.float32
+            )
         
-        # Normalize to unit length
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
+        # Normalize every row in one pass
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms > 0, norms, 1.0)
         
-        return embedding.tolist()
+        return embeddings
+
+    def _create_embedding(self, text: str) -> List[float]:
+        """
+        Create a deterministic embedding from text using hashing
+        """
+        return self.embed_documents([text])[0]
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """Embed a list of documents"""
-        return [self._create_embedding(text) for text in texts]
+        return self._embedding_matrix(texts).tolist()
     
     def embed_query(self, text: str) -> List[float]:
         """Embed a query"""
@@ -98,7 +117,7 @@ class StubLLM(BaseLLM):
             context_extracted = False
             response = ""
             
-            if "Context:" in prompt or "context:" in prompt:
+            if _CONTEXT_RE.search(prompt):
                 response = (
                     "Based on the provided context, I can help answer your question. "
                     "However, I am currently running in stub mode (no OpenAI API key detected). "
@@ -107,7 +126,7 @@ class StubLLM(BaseLLM):
                     "[citation:2]"
                 )
                 context_extracted = True
-            elif "question" in prompt.lower() or "answer" in prompt.lower():
+            elif _QUESTION_RE.search(prompt):
                 response = (
                     "I understand your question, but I'm currently running in stub mode. "
                     "Please set up your OpenAI API key to get real, context-aware responses from Fortes Education."
@@ -142,15 +161,24 @@ def create_stub_llm() -> StubLLM:
     return StubLLM()
 
 
+def is_stub_embeddings(embeddings: Embeddings) -> bool:
+    """Check if embeddings are stub embeddings, directly or behind a caching wrapper"""
+    return isinstance(getattr(embeddings, "inner", embeddings), StubEmbeddings)
+
+
 def check_openai_key_available() -> bool:
     """Check if OpenAI API key is configured"""
     from app.core.config import settings
     return bool(settings.OPENAI_API_KEY and settings.OPENAI_API_KEY != "your-openai-api-key-here")
 
 
+@cache
 def get_embeddings_with_fallback() -> Embeddings:
     """
     Get embeddings with automatic fallback to stub if OpenAI key unavailable
+
+    The instance is created once and shared, so repeated callers reuse its
+    client setup.
     """
     from app.core.config import settings
     
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 
@@ -31,6 +31,21 @@ class BaseVectorStore(ABC):
         """Search for similar documents"""
         pass
     
+    @abstractmethod
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search for documents similar to a precomputed query embedding"""
+        pass
+    
+    def similarity_search_by_vector_with_embeddings(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, Optional[List[float]]]]:
+        """
+        Search by a query embedding, pairing each document with its stored vector
+
+        Stores that cannot return stored vectors pair every document with None.
+        """
+        return [(doc, None) for doc in self.similarity_search_by_vector(embedding, k=k, **kwargs)]
+    
     @abstractmethod
     def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
         """Search for similar documents with score"""
@@ -1,5 +1,8 @@
-from typing import List, Any
-import os
+from typing import List, Any, Optional, Tuple
+import logging
+import uuid
+from functools import lru_cache
+from pathlib import Path
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_chroma import Chroma
@@ -8,31 +11,81 @@ from app.core.config import settings
 
 from .base import BaseVectorStore
 
+logger = logging.getLogger(__name__)
+
+# Local fallback storage: backend/data/chroma_db
+_PERSIST_DIRECTORY = Path(__file__).parents[3] / "data" / "chroma_db"
+
+
+@lru_cache(maxsize=1)
+def _get_http_client():
+    """
+    Shared HTTP client, cached only once a heartbeat has succeeded
+
+    The HTTP client connects lazily, so the heartbeat checks up front that the
+    server is reachable. lru_cache does not cache exceptions, so an
+    unreachable server is retried on the next call.
+    """
+    chroma_client = chromadb.HttpClient(
+        host=settings.CHROMA_DB_HOST,
+        port=settings.CHROMA_DB_PORT,
+    )
+    chroma_client.heartbeat()
+    return chroma_client
+
+
+@lru_cache(maxsize=1)
+def _get_local_client():
+    """Shared client for persistent local storage"""
+    _PERSIST_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    return chromadb.PersistentClient(path=str(_PERSIST_DIRECTORY))
+
+
+def _get_chroma_client():
+    """
+    Chroma client for a collection
+
+    Prefers the server; local storage serves only while the server is
+    unreachable, so a brief outage at startup does not pin the process to it.
+    """
+    try:
+        # Try HTTP client first for production use
+        return _get_http_client()
+    except Exception as e:
+        # Fall back to persistent local storage for development
+        logger.warning(f"Chroma server unavailable ({e}), using local storage at {_PERSIST_DIRECTORY}")
+        return _get_local_client()
+
+
 class ChromaVectorStore(BaseVectorStore):
     """Chroma vector store implementation"""
+
+    # Documents embedded and written per round trip; keeps each embedding
+    # request well inside provider input and token limits
+    ADD_BATCH_SIZE = 256
     
     def __init__(self, collection_name: str, embedding_function: Embeddings, **kwargs):
         """Initialize Chroma vector store"""
-        try:
-            # Try HTTP client first for production use
-            chroma_client = chromadb.HttpClient(
-                host=settings.CHROMA_DB_HOST,
-                port=settings.CHROMA_DB_PORT,
-            )
-        except Exception:
-            # Fall back to persistent local storage for development
-            persist_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "data", "chroma_db")
-            os.makedirs(persist_directory, exist_ok=True)
-            chroma_client = chromadb.PersistentClient(path=persist_directory)
-        
         self._store = Chroma(
-            client=chroma_client,
+            client=_get_chroma_client(),
             collection_name=collection_name,
             embedding_function=embedding_function,
         )
+
     def add_documents(self, documents: List[Document]) -> None:
-        """Add documents to Chroma"""
-        self._store.add_documents(documents)
+        """
+        Add documents to Chroma in batches
+
+        add_texts embeds each batch with one embed_documents call and writes
+        it to the collection in one upsert.
+        """
+        for start in range(0, len(documents), self.ADD_BATCH_SIZE):
+            batch = documents[start:start + self.ADD_BATCH_SIZE]
+            self._store.add_texts(
+                texts=[doc.page_content for doc in batch],
+                metadatas=[doc.metadata for doc in batch],
+                ids=[doc.id or str(uuid.uuid4()) for doc in batch],
+            )
     
     def delete(self, ids: List[str]) -> None:
         """Delete documents from Chroma"""
@@ -43,9 +96,29 @@ class ChromaVectorStore(BaseVectorStore):
         return self._store.as_retriever(**kwargs)
     
     def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
-        """Search for similar documents in Chroma"""
+        """
+        Search for similar documents in Chroma
+
+        The query is embedded through the store's embedding function; stores
+        built from EmbeddingsFactory share its LRU, so repeated queries skip
+        the embedding round trip.
+        """
         return self._store.similarity_search(query, k=k, **kwargs)
     
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search for documents similar to a precomputed query embedding in Chroma"""
+        return self._store.similarity_search_by_vector(embedding, k=k, **kwargs)
+    
+    def similarity_search_by_vector_with_embeddings(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, Optional[List[float]]]]:
+        """Search Chroma by a query embedding and fetch the stored vectors of the hits"""
+        docs = self._store.similarity_search_by_vector(embedding, k=k, **kwargs)
+        ids = [doc.id for doc in docs if doc.id]
+        stored = self._store.get(ids=ids, include=["embeddings"]) if ids else {"ids": [], "embeddings": []}
+        vectors = dict(zip(stored["ids"], stored["embeddings"]))
+        return [(doc, vectors.get(doc.id)) for doc in docs]
+    
     def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
         """Search for similar documents in Chroma with score"""
         return self._store.similarity_search_with_score(query, k=k, **kwargs)
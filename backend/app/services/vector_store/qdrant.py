@@ -1,7 +1,8 @@
-from typing import List, Any
+from typing import List, Any, Dict, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import Qdrant
+from qdrant_client import models
 from app.core.config import settings
 
 from .base import BaseVectorStore
@@ -17,10 +18,45 @@ class QdrantStore(BaseVectorStore):
             url=settings.QDRANT_URL,
             prefer_grpc=settings.QDRANT_PREFER_GRPC
         )
+        self._quantized = False
+    
+    def _ensure_quantization(self) -> None:
+        """
+        Keep an int8 copy of the collection's vectors in RAM for search
+
+        Full-precision vectors stay stored and are used to rescore candidates,
+        so recall is preserved while scans touch a quarter of the memory.
+        """
+        if not settings.QDRANT_INT8_QUANTIZATION or self._quantized:
+            return
+
+        client = self._store.client
+        collection_name = self._store.collection_name
+        if client.get_collection(collection_name).config.quantization_config is None:
+            client.update_collection(
+                collection_name=collection_name,
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True,
+                    )
+                ),
+            )
+        self._quantized = True
+    
+    def _search_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Rescore quantized candidates with the original vectors"""
+        if settings.QDRANT_INT8_QUANTIZATION:
+            kwargs.setdefault("search_params", models.SearchParams(
+                quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+            ))
+        return kwargs
     
     def add_documents(self, documents: List[Document]) -> None:
         """Add documents to Qdrant"""
         self._store.add_documents(documents)
+        self._ensure_quantization()
     
     def delete(self, ids: List[str]) -> None:
         """Delete documents from Qdrant"""
@@ -32,11 +68,32 @@ class QdrantStore(BaseVectorStore):
     
     def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
         """Search for similar documents in Qdrant"""
-        return self._store.similarity_search(query, k=k, **kwargs)
+        return self._store.similarity_search(query, k=k, **self._search_kwargs(kwargs))
+    
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        """Search for documents similar to a precomputed query embedding in Qdrant"""
+        return self._store.similarity_search_by_vector(embedding, k=k, **self._search_kwargs(kwargs))
+    
+    def similarity_search_by_vector_with_embeddings(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, Optional[List[float]]]]:
+        """Search Qdrant by a query embedding and fetch the stored vectors of the hits"""
+        docs = self.similarity_search_by_vector(embedding, k=k, **kwargs)
+        ids = [doc.metadata["_id"] for doc in docs if "_id" in doc.metadata]
+        vectors = {}
+        if ids:
+            for point in self._store.client.retrieve(
+                collection_name=self._store.collection_name, ids=ids, with_vectors=True
+            ):
+                vector = point.vector
+                if isinstance(vector, dict):
+                    vector = vector.get(self._store.vector_name)
+                vectors[point.id] = vector
+        return [(doc, vectors.get(doc.metadata.get("_id"))) for doc in docs]
     
     def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
         """Search for similar documents in Qdrant with score"""
-        return self._store.similarity_search_with_score(query, k=k, **kwargs)
+        return self._store.similarity_search_with_score(query, k=k, **self._search_kwargs(kwargs))
 
     def delete_collection(self) -> None:
         """Delete the entire collection"""
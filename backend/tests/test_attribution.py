@@ -0,0 +1,133 @@
+"""
+Tests for Attribution Service
+"""
+
+import pytest
+from app.services.attribution import AttributionService
+from app.services.stub_services import create_stub_embeddings
+
+
+class TestAttributionService:
+    """Test suite for sentence-level attribution"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        self.attribution = AttributionService()
+        self.chunks = [
+            {"doc_id": "doc1.md", "chunk_id": "chunk_0", "content": "the cat sat on the mat"},
+            {"doc_id": "doc2.md", "chunk_id": "chunk_1", "content": "the dog sat"},
+            {"doc_id": "doc3.md", "chunk_id": "chunk_2", "content": ""},
+            {"doc_id": "doc4.md", "chunk_id": "chunk_3", "content": "The cat sat on mat"},
+        ]
+
+    def test_sentence_split_keeps_abbreviations(self):
+        """Test that abbreviations do not end a sentence"""
+        text = "Ask Dr. Smith, e.g. about this. Mrs. Jones agreed! Did Mr. X, i.e. the boss, leave? Pens, etc. are here."
+        sentences = self.attribution.split_into_sentences(text)
+
+        assert sentences == [
+            "Ask Dr. Smith, e.g. about this.",
+            "Mrs. Jones agreed!",
+            "Did Mr. X, i.e. the boss, leave?",
+            "Pens, etc. are here.",
+        ], f"Unexpected split: {sentences}"
+
+    def test_vectorized_scores_match_pairwise_jaccard(self):
+        """Test that batched chunk scoring matches the per-chunk similarity"""
+        index = self.attribution.build_chunk_index(self.chunks)
+
+        for sentence in ["the cat sat on the mat", "the dog sat", "nothing in common", ""]:
+            scores = self.attribution.score_chunks(sentence, index)
+            expected = [
+                self.attribution.calculate_sentence_similarity(sentence, chunk)
+                for chunk in self.chunks
+            ]
+            assert scores.tolist() == pytest.approx(expected), f"Score mismatch for: {sentence!r}"
+
+    def test_chunk_tokens_cached(self):
+        """Test that chunk content is tokenized once and reused"""
+        chunk = self.chunks[0]
+        tokens = self.attribution.chunk_tokens(chunk)
+
+        assert tokens == {"the", "cat", "sat", "on", "mat"}
+        assert self.attribution.chunk_tokens(chunk) is tokens, "Should reuse cached token set"
+
+    def test_supporting_chunks_ranked(self):
+        """Test that supporting chunks are thresholded and ranked by similarity"""
+        citations = self.attribution.find_supporting_chunks("the cat sat on the mat", self.chunks)
+
+        assert [c.chunk_id for c in citations] == ["chunk_0", "chunk_3"], "Should keep retrieval order on ties"
+        assert all(c.similarity_score >= AttributionService.CITATION_THRESHOLD for c in citations)
+
+    def test_supporting_chunks_top_k(self):
+        """Test that at most top_k citations are returned"""
+        citations = self.attribution.find_supporting_chunks("the cat sat on the mat", self.chunks, top_k=1)
+        assert len(citations) == 1, "Should return at most top_k citations"
+
+    def test_annotate_response(self):
+        """Test hallucination flagging on annotated sentences"""
+        sentences, has_hallucination, stats = self.attribution.annotate_response(
+            "The cat sat on the mat. Completely unrelated claim.", self.chunks
+        )
+
+        assert len(sentences) == 2, "Should split into two sentences"
+        assert sentences[0].is_supported, "First sentence is grounded"
+        assert not sentences[1].is_supported, "Second sentence is unsupported"
+        assert has_hallucination, "Unsupported sentence should flag hallucination"
+        assert stats["hallucination_rate"] == 0.5
+
+    def test_annotate_response_for_api_matches_formatted(self):
+        """Test that the fused API path equals annotate + format"""
+        text = "The cat sat on the mat. The dog sat. Completely unrelated claim."
+
+        annotated, has_hallucination, stats = self.attribution.annotate_response(text, self.chunks)
+        expected = self.attribution.format_citations_for_response(annotated)
+
+        assert self.attribution.annotate_response_for_api(text, self.chunks) == (
+            expected, has_hallucination, stats
+        ), "Fused output should match the two-pass output"
+
+    def test_annotate_response_without_chunks(self):
+        """Test annotation when nothing was retrieved"""
+        sentences, has_hallucination, stats = self.attribution.annotate_response("Some answer.", [])
+
+        assert has_hallucination, "No chunks means no support"
+        assert stats["average_confidence"] == 0.0
+
+    def test_annotate_response_with_embeddings(self):
+        """Test cosine attribution against the chunk embeddings retrieval returned"""
+        embeddings = create_stub_embeddings()
+        chunks = [
+            # Retrieval vectors are used as-is; chunk content is not re-embedded
+            {"chunk_id": "chunk_0", "content": "ignored", "embedding": embeddings.embed_query("Guardrails redact PII.")},
+            {"chunk_id": "chunk_1", "content": "ignored", "embedding": embeddings.embed_query("Chroma stores vectors.")},
+        ]
+
+        sentences, has_hallucination, _ = self.attribution.annotate_response(
+            "Guardrails redact PII. Chroma stores vectors. Unrelated.", chunks, embeddings=embeddings
+        )
+
+        assert [s.citations[0].chunk_id for s in sentences[:2]] == ["chunk_0", "chunk_1"]
+        assert sentences[0].confidence == pytest.approx(1.0, abs=1e-5)
+        assert not sentences[2].is_supported, "Unrelated sentence should be unsupported"
+        assert has_hallucination
+
+    def test_annotate_response_without_chunk_embeddings_uses_word_overlap(self):
+        """Test that chunks without retrieval vectors fall back to Jaccard"""
+        chunks = [{
+            "chunk_id": "chunk_0",
+            "content": "The Eiffel Tower is located in Paris. It was completed in 1889."
+        }]
+
+        sentences, has_hallucination, stats = self.attribution.annotate_response(
+            "The Eiffel Tower is located in Paris and was completed in 1889.",
+            chunks,
+            embeddings=create_stub_embeddings()
+        )
+
+        assert sentences[0].is_supported, "Word overlap should support the paraphrase"
+        assert not has_hallucination
+        assert stats["hallucination_rate"] == 0.0
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -60,6 +60,17 @@ class TestEnhancedChunker:
             assert chunk.line_start > 0, "Line numbers should be positive"
             assert chunk.line_end >= chunk.line_start, "Line end should be >= line start"
 
+    def test_char_offsets_match_content(self):
+        """Test that char offsets locate each chunk even when words repeat"""
+        text = "the cat\nthe dog\n" * 30
+        chunker = EnhancedChunker(chunk_size=7, chunk_overlap=2)
+
+        for chunk in chunker.chunk_text(text, "test.txt"):
+            span = text[chunk.char_start:chunk.char_end]
+            assert span.split() == chunk.content.split(), "Offsets should cover the chunk's words"
+            assert chunk.line_start == text[:chunk.char_start].count("\n") + 1
+            assert chunk.line_end == text[:chunk.char_end].count("\n") + 1
+
     def test_chunk_overlap(self):
         """Test that chunk overlap works correctly"""
         text = " ".join([f"word{i}" for i in range(200)])  # 200 words
@@ -107,6 +118,26 @@ class TestEnhancedChunker:
         assert "line_start" in chunk_dicts[0], "Should have line_start"
         assert "line_end" in chunk_dicts[0], "Should have line_end"
 
+    def test_soa_matches_chunks(self):
+        """Test that the column layout carries the same chunks as chunk_text"""
+        text = "Line one here\nLine two here\n" * 20
+        chunks = self.chunker.chunk_text(text, "test.txt")
+        batch = self.chunker.chunk_text_soa(text, "test.txt")
+
+        assert len(batch) == len(chunks), "Should produce the same number of chunks"
+        assert batch.contents == [c.content for c in chunks], "Contents should match"
+        assert batch.line_starts.tolist() == [c.line_start for c in chunks], "Line starts should match"
+        assert batch.char_ends.tolist() == [c.char_end for c in chunks], "Char ends should match"
+
+    def test_chunk_batch_matches_per_document(self):
+        """Test that batch chunking equals chunking each document in turn"""
+        documents = [("First doc text. " * 20, "a.txt"), ("Second doc text. " * 20, "b.txt")]
+
+        chunks = self.chunker.chunk_batch(documents, {"source": "upload"})
+
+        assert chunks == [c for text, name in documents for c in self.chunker.chunk_text(text, name, {"source": "upload"})]
+        assert {c.metadata["filename"] for c in chunks} == {"a.txt", "b.txt"}, "Filenames should not leak across documents"
+
     def test_line_chunking(self):
         """Test line-based chunking strategy"""
         text = "\n".join([f"Line {i}" for i in range(50)])
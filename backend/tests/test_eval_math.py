@@ -2,6 +2,7 @@
 Sanity tests for evaluation metrics math
 """
 
+import asyncio
 import pytest
 import sys
 from pathlib import Path
@@ -9,7 +10,8 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from run_eval import EvaluationMetrics
+from run_eval import EvaluationMetrics, embed_texts
+from app.services.stub_services import create_stub_embeddings
 
 
 class TestEvaluationMath:
@@ -67,11 +69,81 @@ class TestEvaluationMath:
 
         assert result == 0.5, f"F1 should be 0.5, got {result}"
 
+    def test_f1_repeated_words(self):
+        """Test that repeated words only match as often as they occur in both"""
+        result = EvaluationMetrics.f1_score("the the cat", "the cat")
+
+        # 2 of 3 predicted words match, both expected words match
+        # Precision = 2/3, Recall = 1, F1 = 0.8
+        assert result == pytest.approx(0.8), f"F1 should be 0.8, got {result}"
+
     def test_f1_empty_strings(self):
         """Test F1 score with empty strings"""
         result = EvaluationMetrics.f1_score("", "")
         assert result == 0.0, "Empty strings should have F1 = 0.0"
 
+    def test_batch_f1_matches_pairwise(self):
+        """Test that the batched F1 equals the per-pair F1"""
+        predicted = ["the quick brown fox", "hello world", "", "apple banana cherry", "same same"]
+        expected = ["the quick red fox", "foo bar", "", "apple banana date", "same"]
+
+        result = EvaluationMetrics.batch_f1(predicted, expected)
+
+        assert result.tolist() == pytest.approx(
+            [EvaluationMetrics.f1_score(p, e) for p, e in zip(predicted, expected)]
+        )
+
+    def test_em_and_f1_matches_separate_metrics(self):
+        """Test that the fused pass agrees with exact_match and f1_score"""
+        for predicted, expected in [("Hello World", "hello world "), ("the the cat", "the cat"), ("a", "b")]:
+            assert EvaluationMetrics.em_and_f1(predicted, expected) == (
+                EvaluationMetrics.exact_match(predicted, expected),
+                EvaluationMetrics.f1_score(predicted, expected),
+            )
+
+    def test_batch_semantic_similarity(self):
+        """Test batched cosine similarity against identical and different answers"""
+        embeddings = create_stub_embeddings()
+        predicted = ["hello world", "hello world", "foo bar"]
+        expected = ["hello world", "goodbye world", "foo bar"]
+
+        result = EvaluationMetrics.batch_semantic_similarity(predicted, expected, embeddings)
+
+        assert result[0] == pytest.approx(1.0, abs=1e-5), "Identical answers should score 1.0"
+        assert result[1] < 0.5, "Different stub answers should be nearly orthogonal"
+        assert result[2] == pytest.approx(1.0, abs=1e-5)
+        assert EvaluationMetrics.semantic_similarity("hello world", "goodbye world", embeddings) == pytest.approx(result[1])
+
+    def test_exact_match_skips_embedding(self):
+        """Test that exact matches score 1.0 without embedding and agree with the embedding path"""
+        embeddings = create_stub_embeddings()
+        predicted = ["Hello world", "foo bar"]
+        expected = ["Hello world", "baz"]
+        exact = [EvaluationMetrics.exact_match(p, e) == 1.0 for p, e in zip(predicted, expected)]
+
+        shortcut = EvaluationMetrics.batch_semantic_similarity(predicted, expected, embeddings, exact_matches=exact)
+        embedded = EvaluationMetrics.batch_semantic_similarity(predicted, expected, embeddings)
+
+        assert shortcut[0] == 1.0
+        assert shortcut.tolist() == pytest.approx(embedded.tolist(), abs=1e-6)
+
+    def test_embed_texts_batches_keep_order(self):
+        """Test that concurrently embedded batches come back in input order"""
+        embeddings = create_stub_embeddings()
+        texts = [f"text {i}" for i in range(10)]
+
+        assert embed_texts(embeddings, texts, batch_size=3, max_concurrency=2) == embeddings.embed_documents(texts)
+
+    def test_embed_texts_inside_running_loop(self):
+        """Test that embedding from inside an event loop falls back to sequential batches"""
+        embeddings = create_stub_embeddings()
+        texts = [f"text {i}" for i in range(10)]
+
+        async def embed_from_loop():
+            return embed_texts(embeddings, texts, batch_size=3)
+
+        assert asyncio.run(embed_from_loop()) == embeddings.embed_documents(texts)
+
     def test_citation_accuracy_all_present(self):
         """Test citation accuracy when all expected citations are present"""
         predicted = ["doc1.md", "doc2.md", "doc3.md"]
@@ -113,18 +185,24 @@ class TestEvaluationMath:
         # Should match because expected is substring of predicted
         assert result == 1.0, "Substring match should count"
 
-    def test_normalize_text(self):
+    def test_citation_accuracy_exact_and_substring(self):
+        """Test that exact and substring matches are counted together"""
+        predicted = ["doc1.md", "01_fortes_eduction_overview.md"]
+        expected = ["doc1.md", "overview.md", "doc9.md"]
+
+        result = EvaluationMetrics.citation_accuracy(predicted, expected)
+        assert result == pytest.approx(2 / 3), "2 of 3 citations should match"
+
+    @pytest.mark.parametrize("input_text,expected", [
+        ("  Hello World  ", "hello world"),
+        ("UPPERCASE", "uppercase"),
+        ("MiXeD CaSe", "mixed case"),
+        ("  extra   spaces  ", "extra   spaces"),
+    ])
+    def test_normalize_text(self, input_text, expected):
         """Test text normalization"""
-        tests = [
-            ("  Hello World  ", "hello world"),
-            ("UPPERCASE", "uppercase"),
-            ("MiXeD CaSe", "mixed case"),
-            ("  extra   spaces  ", "extra   spaces"),
-        ]
-
-        for input_text, expected in tests:
-            result = EvaluationMetrics.normalize_text(input_text)
-            assert result == expected, f"Normalization failed for '{input_text}'"
+        result = EvaluationMetrics.normalize_text(input_text)
+        assert result == expected, f"Normalization failed for '{input_text}'"
 
     def test_f1_precision_recall_calculation(self):
         """Test F1 calculation logic step by step"""
@@ -0,0 +1,56 @@
+"""
+Tests for LLM and Embeddings factories
+"""
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+pytest.importorskip("langchain_deepseek")
+pytest.importorskip("langchain_ollama")
+pytest.importorskip("langchain_community")
+
+from app.services.embedding.cached_embeddings import CachedEmbeddings
+from app.services.embedding.embedding_factory import EmbeddingsFactory
+from app.services.llm.llm_factory import LLMFactory
+from app.services.stub_services import StubEmbeddings, StubLLM, create_stub_embeddings
+
+
+class TestFactoryFallback:
+    """A failed provider init falls back to a stub without pinning it"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        EmbeddingsFactory._create_cached.cache_clear()
+        LLMFactory._create_cached.cache_clear()
+
+    def teardown_method(self):
+        """Drop instances built by the test"""
+        EmbeddingsFactory._create_cached.cache_clear()
+        LLMFactory._create_cached.cache_clear()
+
+    def test_failed_embeddings_init_is_retried(self, monkeypatch):
+        """Test that the stub is not cached after a failed embeddings init"""
+        attempts = []
+
+        def flaky_build(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise ConnectionError("provider unavailable")
+            return create_stub_embeddings()
+
+        monkeypatch.setattr(EmbeddingsFactory, "_build", staticmethod(flaky_build))
+
+        assert isinstance(EmbeddingsFactory.create(), StubEmbeddings), "Failure should fall back to the stub"
+        recovered = EmbeddingsFactory.create()
+        assert isinstance(recovered, CachedEmbeddings), "Next call should retry the provider"
+        assert EmbeddingsFactory.create() is recovered, "Successful instance should be shared"
+        assert len(attempts) == 2
+
+    def test_failed_llm_init_is_retried(self):
+        """Test that the stub LLM is not cached after a failed init"""
+        assert isinstance(LLMFactory.create(provider="unsupported"), StubLLM)
+        assert LLMFactory._create_cached.cache_info().currsize == 0, "Failure should not be cached"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,278 @@
+"""
+Tests for Observability Service
+"""
+
+import sys
+import types
+import pytest
+import numpy as np
+from app.services import observability
+from app.services.observability import PromptCache, SemanticPromptCache, TokenCostTracker
+
+
+class TestPromptCache:
+    """Test suite for the in-memory prompt cache"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        self.cache = PromptCache(max_size=2)
+
+    def test_set_and_get(self):
+        """Test that a stored result is returned for the same query and corpus"""
+        self.cache.set("What is RAG?", "kb1", {"response": "answer"})
+
+        assert self.cache.get("What is RAG?", "kb1") == {"response": "answer"}
+        assert self.cache.get("What is RAG?", "kb2") is None, "Other corpora should miss"
+
+    def test_evicts_least_recently_used(self):
+        """Test that a hit protects an entry from eviction"""
+        self.cache.set("first", "kb1", 1)
+        self.cache.set("second", "kb1", 2)
+        self.cache.get("first", "kb1")
+        self.cache.set("third", "kb1", 3)
+
+        assert self.cache.get("first", "kb1") == 1, "Recently read entry should survive"
+        assert self.cache.get("second", "kb1") is None, "Least recently used entry should be evicted"
+        assert len(self.cache.cache) == 2
+
+    def test_update_does_not_evict(self):
+        """Test that overwriting an existing key keeps the other entries"""
+        self.cache.set("first", "kb1", 1)
+        self.cache.set("second", "kb1", 2)
+        self.cache.set("first", "kb1", 10)
+
+        assert self.cache.get("first", "kb1") == 10
+        assert self.cache.get("second", "kb1") == 2
+
+    def test_evicts_to_byte_budget(self):
+        """Test that large results push out older entries to stay within max_bytes"""
+        cache = PromptCache(max_size=100, max_bytes=3000)
+        cache.set("first", "kb1", "x" * 1000)
+        cache.set("second", "kb1", "x" * 1000)
+        cache.set("third", "kb1", "x" * 1500)
+
+        assert cache.get("first", "kb1") is None, "Oldest entry should be evicted for space"
+        assert cache.get("third", "kb1") is not None
+        assert cache.get_stats()["bytes_used"] <= 3000
+
+    def test_oversized_result_not_cached(self):
+        """Test that a result larger than the whole budget is skipped"""
+        cache = PromptCache(max_bytes=100)
+        cache.set("query", "kb1", "x" * 1000)
+
+        assert cache.get("query", "kb1") is None
+        assert cache.get_stats()["bytes_used"] == 0
+
+    def test_expired_entry_misses(self):
+        """Test that entries older than the TTL are dropped"""
+        cache = PromptCache(ttl_seconds=-1)
+        cache.set("query", "kb1", 1)
+
+        assert cache.get("query", "kb1") is None, "Expired entry should miss"
+        assert len(cache.cache) == 0, "Expired entry should be removed"
+
+    def test_expired_entries_swept_on_set(self):
+        """Test that writes sweep expired entries without reading them"""
+        cache = PromptCache(ttl_seconds=-1)
+        cache.set("first", "kb1", 1)
+        cache.set("second", "kb1", 2)
+
+        assert len(cache.cache) == 1, "Expired entry should be swept before insert"
+
+    def test_rewritten_entry_survives_sweep(self):
+        """Test that a stale expiry record does not drop a refreshed entry"""
+        self.cache.set("query", "kb1", 1)
+        key = self.cache._generate_key("query", "kb1")
+        # Pretend the first write's expiry has passed
+        self.cache._expiry[0] = (0.0, key)
+        self.cache.set("query", "kb1", 2)
+
+        assert self.cache.get("query", "kb1") == 2, "Refreshed entry should stay cached"
+
+
+class TestSemanticPromptCache:
+    """Test suite for the embedding-matched prompt cache"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        self.cache = SemanticPromptCache(similarity_threshold=0.8, max_size=3)
+
+    def test_hit_at_or_above_threshold(self):
+        """Test that a close query reuses the cached result"""
+        self.cache.set([1.0, 0.0], "kb1", "answer")
+
+        assert self.cache.get([3.0, 0.0], "kb1") == "answer", "Same direction should hit"
+        assert self.cache.get([0.8, 0.6], "kb1") == "answer", "Similarity at the threshold should hit"
+
+    def test_miss_below_threshold(self):
+        """Test that a dissimilar query or another corpus misses"""
+        self.cache.set([1.0, 0.0], "kb1", "answer")
+
+        assert self.cache.get([0.6, 0.8], "kb1") is None, "Similarity 0.6 is below 0.8"
+        assert self.cache.get([1.0, 0.0], "kb2") is None, "Other corpora should miss"
+
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are not returned"""
+        cache = SemanticPromptCache(similarity_threshold=0.8, ttl_seconds=-1)
+        cache.set([1.0, 0.0], "kb1", "answer")
+
+        assert cache.get([1.0, 0.0], "kb1") is None
+
+    def test_expired_best_match_falls_back_to_live_entry(self):
+        """Test that a stale nearest entry does not hide a fresh one above the threshold"""
+        self.cache.set([1.0, 0.0], "kb1", "stale")
+        self.cache.set([0.9, 0.1], "kb1", "fresh")
+        self.cache.cache["kb1"].timestamps[0] = 0.0  # Expire the exact match
+
+        assert self.cache.get([1.0, 0.0], "kb1") == "fresh"
+
+    def test_evicts_oldest_at_max_size(self):
+        """Test that a full corpus overwrites its oldest entry"""
+        for i, vector in enumerate([[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0], [0.0, -1.0]]):
+            self.cache.set(vector, "kb1", i)
+
+        assert self.cache.get([1.0, 0.0], "kb1") is None, "Oldest entry should be evicted"
+        assert [self.cache.get(v, "kb1") for v in ([0.0, 1.0], [-1.0, 0.0], [0.0, -1.0])] == [1, 2, 3]
+        assert self.cache.get_stats()["size"] == 3
+
+    def test_grows_past_initial_capacity(self):
+        """Test that entries beyond the initial buffer are kept up to max_size"""
+        cache = SemanticPromptCache(similarity_threshold=0.99, max_size=40)
+        angles = np.linspace(0, np.pi, 40, endpoint=False)
+        for i, angle in enumerate(angles):
+            cache.set([np.cos(angle), np.sin(angle)], "kb1", i)
+
+        assert [cache.get([np.cos(a), np.sin(a)], "kb1") for a in angles] == list(range(40))
+
+    def test_zero_vectors_ignored(self):
+        """Test that zero embeddings are neither stored nor matched"""
+        self.cache.set([0.0, 0.0], "kb1", "answer")
+        assert self.cache.get_stats()["size"] == 0
+
+        self.cache.set([1.0, 0.0], "kb1", "answer")
+        assert self.cache.get([0.0, 0.0], "kb1") is None
+
+
+class FakeEncoder:
+    """Tokenizer stand-in that splits on whitespace and counts encode calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+
+class TestTokenCounting:
+    """Test suite for tokenizer selection and token counting"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        observability._get_encoder.cache_clear()
+        self.tracker = TokenCostTracker()
+
+    def teardown_method(self):
+        """Drop any encoder a test cached"""
+        observability._get_encoder.cache_clear()
+
+    def fake_tiktoken(self, monkeypatch, for_model, get_encoding):
+        """Install a fake tiktoken module"""
+        module = types.SimpleNamespace(encoding_for_model=for_model, get_encoding=get_encoding)
+        monkeypatch.setitem(sys.modules, "tiktoken", module)
+
+    def test_counts_with_tokenizer(self, monkeypatch):
+        """Test that the model tokenizer is used when available"""
+        encoder = FakeEncoder()
+        monkeypatch.setattr(observability, "_get_encoder", lambda: encoder)
+
+        assert self.tracker.estimate_tokens("one two three") == 3
+
+    def test_falls_back_to_char_estimate(self, monkeypatch):
+        """Test the ~4 chars per token estimate without a tokenizer"""
+        monkeypatch.setattr(observability, "_get_encoder", lambda: None)
+
+        assert self.tracker.estimate_tokens("x" * 41) == 10
+
+    def test_token_counts_cached_lru(self, monkeypatch):
+        """Test that repeated texts are counted once and the cache is bounded"""
+        encoder = FakeEncoder()
+        monkeypatch.setattr(observability, "_get_encoder", lambda: encoder)
+        self.tracker.TOKEN_COUNT_CACHE_SIZE = 2
+
+        self.tracker.estimate_tokens("a")
+        self.tracker.estimate_tokens("b")
+        self.tracker.estimate_tokens("a")
+        assert encoder.calls == 2, "Repeated text should hit the cache"
+
+        self.tracker.estimate_tokens("c")  # evicts "b", the least recently used
+        self.tracker.estimate_tokens("a")
+        assert encoder.calls == 3, "Recently used text should survive eviction"
+        self.tracker.estimate_tokens("b")
+        assert encoder.calls == 4, "Evicted text should be counted again"
+        assert len(self.tracker._token_counts) == 2
+
+    def test_unknown_model_uses_base_encoding(self, monkeypatch):
+        """Test that a model unknown to tiktoken gets cl100k_base"""
+        encoder = FakeEncoder()
+
+        def for_model(model):
+            raise KeyError(model)
+
+        self.fake_tiktoken(monkeypatch, for_model, lambda name: encoder if name == "cl100k_base" else None)
+
+        assert observability._get_encoder() is encoder
+
+    def test_failed_fallback_encoding_returns_none(self, monkeypatch):
+        """Test that a failing cl100k_base load degrades to the estimate instead of raising"""
+        def for_model(model):
+            raise KeyError(model)
+
+        def get_encoding(name):
+            raise OSError("offline")
+
+        self.fake_tiktoken(monkeypatch, for_model, get_encoding)
+
+        assert observability._get_encoder() is None
+        assert self.tracker.estimate_tokens("x" * 8) == 2
+
+
+class TestTokenCostTracker:
+    """Test suite for cost estimation"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        self.tracker = TokenCostTracker()
+
+    def test_cost_matches_per_million_pricing(self):
+        """Test that per-token rates agree with the published per-1M prices"""
+        for model, pricing in TokenCostTracker.PRICING.items():
+            expected = 1500 / 1_000_000 * pricing["input"] + 700 / 1_000_000 * pricing["output"]
+            assert self.tracker.calculate_cost(model, 1500, 700) == pytest.approx(expected), model
+
+    def test_unknown_model_uses_default_rates(self):
+        """Test that unknown models are priced as gpt-4o-mini"""
+        assert self.tracker.calculate_cost("unknown-model", 1000, 1000) == pytest.approx(
+            self.tracker.calculate_cost("gpt-4o-mini", 1000, 1000)
+        )
+
+    def test_session_stats_accumulate(self):
+        """Test that logged requests and cache lookups roll up into session stats"""
+        self.tracker.log_request("generation", "gpt-4o", 1000, 200)
+        self.tracker.log_request("embedding", "text-embedding-3-small", 500)
+        self.tracker.record_cache_lookup(hit=True)
+        self.tracker.record_cache_lookup(hit=False)
+
+        stats = self.tracker.get_session_stats()
+        assert stats["total_requests"] == 2
+        assert stats["total_input_tokens"] == 1500
+        assert stats["total_output_tokens"] == 200
+        assert stats["total_cost"] == pytest.approx(
+            self.tracker.calculate_cost("gpt-4o", 1000, 200)
+            + self.tracker.calculate_cost("text-embedding-3-small", 500)
+        )
+        assert stats["cache_hit_rate"] == 0.5
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
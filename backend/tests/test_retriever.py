@@ -2,116 +2,192 @@
 Tests for Retrieval System
 """
 
+import asyncio
 import pytest
-from app.services.enhanced_chunker import enhanced_chunker
-from app.services.stub_services import create_stub_embeddings
+import numpy as np
+from app.services.enhanced_chunker import DocumentChunk, enhanced_chunker
+from app.services.embedding.cached_embeddings import CachedEmbeddings
+from app.services.stub_services import create_stub_embeddings, is_stub_embeddings
+
+
+class ArrayEmbeddings:
+    """Test adapter that embeds each text once and keeps it as a contiguous array"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self._vectors = {}
+
+    def embed(self, text):
+        vector = self._vectors.get(text)
+        if vector is None:
+            vector = np.ascontiguousarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self._vectors[text] = vector
+        return vector
+
+
+SAMPLE_TEXT = """
+        Fortes Education is an advanced RAG system.
+        It includes guardrails and attribution.
+        The system is designed for Q&A applications.
+        """
+
+LINES_TEXT = "Line 1\nLine 2\nLine 3\nLine 4\nLine 5"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _warmup_chunker():
+    """Run the shared chunker once so first-call costs are not charged to a test"""
+    enhanced_chunker.chunk_text("warmup", "warmup.md")
+
+
+# Chunking is deterministic, so each input is chunked once per module.
+# Tests must treat these results as read-only.
+@pytest.fixture(scope="module")
+def sample_batch():
+    """Chunks of SAMPLE_TEXT as parallel columns"""
+    return enhanced_chunker.chunk_text_soa(SAMPLE_TEXT, "test.md")
+
+
+@pytest.fixture(scope="module")
+def line_chunks():
+    """Chunks of LINES_TEXT"""
+    return enhanced_chunker.chunk_text(LINES_TEXT, "test.txt")
+
+
+@pytest.fixture(scope="module")
+def sample_chunk_dicts():
+    """Vector store dicts for a one-line document"""
+    return enhanced_chunker.chunk_document("Test content for vector storage", "test.md")
+
+
+@pytest.fixture(scope="module")
+def stub():
+    """One stub embeddings model shared by the module"""
+    return create_stub_embeddings()
+
+
+@pytest.fixture(scope="module")
+def embeddings(stub):
+    """Stub embeddings behind the SHA-1 keyed cache, so repeated texts are hits"""
+    return CachedEmbeddings(stub)
+
+
+@pytest.fixture(scope="module")
+def vectors(embeddings):
+    """Embeddings as cached contiguous arrays"""
+    return ArrayEmbeddings(embeddings)
 
 
 class TestRetriever:
     """Test suite for retrieval functionality"""
 
-    def setup_method(self):
-        """Setup for each test"""
-        self.embeddings = create_stub_embeddings()
-
-    def test_embedding_generation(self):
+    def test_embedding_generation(self, embeddings):
         """Test that embeddings are generated correctly"""
         text = "This is a test query"
-        embedding = self.embeddings.embed_query(text)
+        embedding = embeddings.embed_query(text)
 
         assert embedding is not None, "Should generate embedding"
         assert len(embedding) > 0, "Embedding should have dimensions"
-        assert all(isinstance(x, float) for x in embedding), "Embedding values should be floats"
+        assert set(map(type, embedding)) == {float}, "Embedding values should be floats"
 
-    def test_embedding_consistency(self):
+    def test_embedding_consistency(self, stub, embeddings):
         """Test that same text produces same embedding"""
         text = "Consistent text"
 
-        embedding1 = self.embeddings.embed_query(text)
-        embedding2 = self.embeddings.embed_query(text)
+        # Ask the stub directly so a cache hit cannot mask nondeterminism
+        embedding1 = stub.embed_query(text)
+        embedding2 = stub.embed_query(text)
 
-        assert embedding1 == embedding2, "Same text should produce identical embeddings"
+        assert np.array_equal(embedding1, embedding2), "Same text should produce identical embeddings"
+        assert embeddings.embed_query(text) is embeddings.embed_query(text), "Repeat should be a cache hit"
 
-    def test_embedding_difference(self):
+    def test_embedding_difference(self, vectors):
         """Test that different texts produce different embeddings"""
         text1 = "First text"
         text2 = "Second text"
 
-        embedding1 = self.embeddings.embed_query(text1)
-        embedding2 = self.embeddings.embed_query(text2)
+        embedding1 = vectors.embed(text1)
+        embedding2 = vectors.embed(text2)
 
-        assert embedding1 != embedding2, "Different texts should produce different embeddings"
+        # Contiguous arrays compare as raw bytes in one memcmp
+        assert embedding1.tobytes() != embedding2.tobytes(), "Different texts should produce different embeddings"
 
-    def test_batch_embeddings(self):
+    def test_batch_embeddings(self, embeddings):
         """Test batch embedding generation"""
         texts = ["Text 1", "Text 2", "Text 3"]
-        embeddings = self.embeddings.embed_documents(texts)
+        batch = embeddings.embed_documents(texts)
 
-        assert len(embeddings) == 3, "Should generate embeddings for all texts"
-        assert all(len(emb) > 0 for emb in embeddings), "All embeddings should have dimensions"
+        # A ragged batch would not stack into a 2-D matrix
+        matrix = np.asarray(batch)
+        assert matrix.shape[0] == 3, "Should generate embeddings for all texts"
+        assert matrix.ndim == 2 and matrix.shape[1] > 0, "All embeddings should have dimensions"
 
-    def test_chunk_retrieval_preparation(self):
-        """Test that chunks are prepared for retrieval"""
-        text = """
-        Fortes Education is an advanced RAG system.
-        It includes guardrails and attribution.
-        The system is designed for Q&A applications.
-        """
+    def test_batch_matches_single(self, embeddings):
+        """Test that a text embeds the same alone or in a batch"""
+        texts = ["Text 1", "Text 2", "Text 3"]
+        batch = embeddings.embed_documents(texts)
 
-        chunks = enhanced_chunker.chunk_text(text, "test.md")
+        for text, embedding in zip(texts, batch):
+            assert np.array_equal(embedding, embeddings.embed_query(text)), f"Batch vector differs for {text!r}"
 
-        assert len(chunks) > 0, "Should create chunks"
+    def test_stub_vectors_are_float32(self, stub):
+        """Test that stub vectors are built in float32 and are unit length"""
+        batch = stub.embed_documents(["Text 1", "Text 2"])
+        matrix = np.asarray(batch, dtype=np.float32)
 
-        # Verify chunks can be embedded
-        for chunk in chunks[:3]:  # Test first 3 chunks
-            embedding = self.embeddings.embed_query(chunk.content)
-            assert embedding is not None, "Each chunk should be embeddable"
+        assert matrix.astype(np.float64).tolist() == batch, "Values should be exact float32s"
+        assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0, atol=1e-6)
 
-    def test_similarity_calculation(self):
-        """Test basic similarity calculation"""
-        import numpy as np
+    def test_stub_detected_behind_cache(self, stub, embeddings):
+        """Test that stub embeddings are recognized directly and behind the cache"""
+        assert is_stub_embeddings(stub)
+        assert is_stub_embeddings(embeddings)
+        assert not is_stub_embeddings(CachedEmbeddings(ArrayEmbeddings(stub)))
+
+    def test_chunk_retrieval_preparation(self, embeddings, sample_batch):
+        """Test that chunks are prepared for retrieval"""
+        contents = sample_batch.contents
 
-        emb1 = self.embeddings.embed_query("machine learning")
-        emb2 = self.embeddings.embed_query("machine learning")
-        emb3 = self.embeddings.embed_query("cooking recipes")
+        assert len(contents) > 0, "Should create chunks"
 
-        # Calculate cosine similarity
-        def cosine_sim(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+        # Verify chunks can be embedded, first 3 in one batch
+        batch = embeddings.embed_documents(contents[:3])
+        matrix = np.asarray(batch)
+        assert matrix.ndim == 2 and matrix.shape[0] == len(contents[:3]), "Each chunk should be embeddable"
+        assert matrix.shape[1] > 0, "Each chunk should be embeddable"
 
-        sim_identical = cosine_sim(emb1, emb2)
-        sim_different = cosine_sim(emb1, emb3)
+    def test_similarity_calculation(self, vectors):
+        """Test basic similarity calculation"""
+        emb1 = vectors.embed("machine learning")
+        emb2 = vectors.embed("machine learning")
+        emb3 = vectors.embed("cooking recipes")
 
-        assert sim_identical == 1.0, "Identical embeddings should have similarity 1.0"
+        # Stub vectors are unit length, so cosine similarity is the dot product
+        matrix = np.stack([emb1, emb2, emb3])
+        sims = np.matmul(matrix, matrix.T)
+
+        sim_identical = sims[0, 1]
+        sim_different = sims[0, 2]
+
+        assert sim_identical == pytest.approx(1.0, abs=1e-6), "Identical embeddings should have similarity 1.0"
         assert sim_different < 1.0, "Different embeddings should have similarity < 1.0"
 
 
 class TestAttributionRetrieval:
     """Test retrieval for attribution purposes"""
 
-    def setup_method(self):
-        """Setup for each test"""
-        self.embeddings = create_stub_embeddings()
-
-    def test_chunk_metadata_preservation(self):
+    def test_chunk_metadata_preservation(self, line_chunks):
         """Test that chunk metadata is preserved for citations"""
-        text = "Line 1\nLine 2\nLine 3\nLine 4\nLine 5"
-
-        chunks = enhanced_chunker.chunk_text(text, "test.txt")
+        # Verify metadata needed for citations; slotted chunks always carry these fields
+        assert {'doc_id', 'chunk_id', 'line_start', 'line_end'} <= set(DocumentChunk.__slots__)
+        assert all(type(chunk) is DocumentChunk for chunk in line_chunks), "Should be DocumentChunks"
 
-        # Verify metadata needed for citations
-        for chunk in chunks:
-            assert hasattr(chunk, 'doc_id'), "Should have doc_id"
-            assert hasattr(chunk, 'chunk_id'), "Should have chunk_id"
-            assert hasattr(chunk, 'line_start'), "Should have line_start"
-            assert hasattr(chunk, 'line_end'), "Should have line_end"
+        for chunk in line_chunks:
             assert chunk.line_start > 0, "Line numbers should be positive"
 
-    def test_document_dict_for_vector_store(self):
+    def test_document_dict_for_vector_store(self, embeddings, sample_chunk_dicts):
         """Test that chunks can be converted to dict for vector store"""
-        text = "Test content for vector storage"
-
-        chunk_dicts = enhanced_chunker.chunk_document(text, "test.md")
+        chunk_dicts = sample_chunk_dicts
 
         assert len(chunk_dicts) > 0, "Should create chunk dicts"
 
@@ -123,12 +199,53 @@ class TestAttributionRetrieval:
             assert "line_end" in chunk_dict, "Should have line_end"
             assert "metadata" in chunk_dict, "Should have metadata"
 
-            # Verify content is embeddable
-            embedding = self.embeddings.embed_query(chunk_dict["content"])
-            assert len(embedding) > 0, "Content should be embeddable"
+        # Verify content is embeddable
+        batch = embeddings.embed_documents([chunk_dict["content"] for chunk_dict in chunk_dicts])
+        matrix = np.asarray(batch)
+        assert matrix.ndim == 2 and matrix.shape[1] > 0, "Content should be embeddable"
 
 
-def test_retrieval_integration():
+class TestCachedEmbeddings:
+    """Test the embedding cache wrapper"""
+
+    def setup_method(self):
+        """Setup for each test"""
+        self.inner = create_stub_embeddings()
+        self.calls = []
+        embed_documents = self.inner.embed_documents
+
+        def counting_embed_documents(texts):
+            self.calls.append(list(texts))
+            return embed_documents(texts)
+
+        self.inner.embed_documents = counting_embed_documents
+        self.embeddings = CachedEmbeddings(self.inner, max_size=2)
+
+    def test_only_misses_are_embedded(self):
+        """Test that cached texts are not re-embedded"""
+        first = self.embeddings.embed_documents(["Text 1", "Text 2"])
+        second = self.embeddings.embed_documents(["Text 2", "Text 3"])
+
+        assert self.calls == [["Text 1", "Text 2"], ["Text 3"]], "Only uncached texts should be embedded"
+        assert second[0] == first[1], "Cached vector should be returned"
+
+    def test_async_documents_share_cache(self):
+        """Test that the async path fills and reads the same cache"""
+        first = asyncio.run(self.embeddings.aembed_documents(["Text 1", "Text 2"]))
+        second = self.embeddings.embed_documents(["Text 1", "Text 2"])
+
+        assert second == first, "Sync call should hit vectors cached by the async call"
+        assert len(self.calls) == 1, "Only the async miss should reach the inner model"
+
+    def test_lru_eviction(self):
+        """Test that the cache is bounded"""
+        self.embeddings.embed_documents(["Text 1", "Text 2", "Text 3"])
+        self.embeddings.embed_documents(["Text 1"])
+
+        assert self.calls[-1] == ["Text 1"], "Least recently used entry should be evicted"
+
+
+def test_retrieval_integration(embeddings):
     """Integration test for retrieval pipeline"""
     # Create sample documents
     documents = [
@@ -137,15 +254,11 @@ def test_retrieval_integration():
         ("Installation requires Python 3.9 and Node.js 18.", "doc3.md")
     ]
 
-    embeddings = create_stub_embeddings()
-    all_chunks = []
-
-    # Process documents
-    for content, filename in documents:
-        chunks = enhanced_chunker.chunk_text(content, filename)
-        all_chunks.extend(chunks)
+    # Process documents; only the content column is needed for embedding
+    batches = [enhanced_chunker.chunk_text_soa(content, filename) for content, filename in documents]
+    contents = [content for batch in batches for content in batch.contents]
 
-    assert len(all_chunks) > 0, "Should create chunks from documents"
+    assert len(contents) > 0, "Should create chunks from documents"
 
     # Simulate retrieval
     query = "What is Fortes Education?"
@@ -155,9 +268,10 @@ def test_retrieval_integration():
 
     # In real implementation, would calculate similarity and retrieve top-k
     # For test, just verify chunks have necessary data
-    for chunk in all_chunks:
-        chunk_embedding = embeddings.embed_query(chunk.content)
-        assert chunk_embedding is not None, "Each chunk should be embeddable"
+    chunk_embeddings = embeddings.embed_documents(contents)
+    matrix = np.asarray(chunk_embeddings)
+    assert matrix.ndim == 2 and matrix.shape[0] == len(contents), "Each chunk should be embeddable"
+    assert matrix.shape[1] > 0, "Each chunk should be embeddable"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+"""
+Tests for access token verification
+"""
+
+import base64
+import json
+from datetime import timedelta
+
+import pytest
+from jose import JWTError, jwt
+from app.core import security
+from app.core.config import settings
+
+
+def _b64url(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+class TestDecodeAccessToken:
+    """Test suite for the HS256 fast path against python-jose"""
+
+    def test_valid_token(self):
+        """Test that issued tokens decode to their claims"""
+        token = security.create_access_token({"sub": "alice"})
+        payload = security.decode_access_token(token)
+
+        assert payload["sub"] == "alice", "Should decode subject"
+        assert payload == jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+    def test_tampered_payload_rejected(self):
+        """Test that a forged payload fails signature verification"""
+        header, _, signature = security.create_access_token({"sub": "alice"}).split(".")
+        forged = f"{header}.{_b64url({'sub': 'admin', 'exp': 4102444800})}.{signature}"
+
+        with pytest.raises(JWTError):
+            security.decode_access_token(forged)
+
+    def test_wrong_key_rejected(self):
+        """Test that tokens signed with another key are rejected"""
+        token = jwt.encode({"sub": "alice"}, "other-secret", algorithm="HS256")
+
+        with pytest.raises(JWTError):
+            security.decode_access_token(token)
+
+    def test_expired_token_rejected(self):
+        """Test that expired tokens are rejected"""
+        token = security.create_access_token({"sub": "alice"}, expires_delta=timedelta(minutes=-1))
+
+        with pytest.raises(JWTError):
+            security.decode_access_token(token)
+
+    def test_unsigned_token_rejected(self):
+        """Test that alg=none tokens are rejected"""
+        token = f"{_b64url({'alg': 'none', 'typ': 'JWT'})}.{_b64url({'sub': 'alice'})}."
+
+        with pytest.raises(JWTError):
+            security.decode_access_token(token)
+
+    def test_malformed_token_rejected(self):
+        """Test that garbage input raises JWTError"""
+        for token in ["", "abc", "a.b.c", "a.b.c.d"]:
+            with pytest.raises(JWTError):
+                security.decode_access_token(token)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -35,6 +35,20 @@ interface Citation {
   metadata: Record<string, any>;
 }
 
+interface ContextData {
+  context: Array<{
+    page_content: string;
+    metadata: Record<string, any>;
+  }>;
+}
+
+// The context part is raw JSON, or base64-encoded JSON in older messages
+const parseContextData = (contextPart: string): ContextData | null => {
+  const trimmed = contextPart.trim();
+  if (!trimmed) return null;
+  return JSON.parse(trimmed.startsWith("{") ? trimmed : atob(trimmed));
+};
+
 // Extend the default useChat message type
 declare module "ai/react" {
   interface Message {
@@ -100,17 +114,10 @@ export default function ChatPage({ params }: { params: { id: string } }) {
             };
           }
 
-          const [base64Part, responseText] =
+          const [contextPart, responseText] =
             msg.content.split("__LLM_RESPONSE__");
 
-          const contextData = base64Part
-            ? (JSON.parse(atob(base64Part.trim())) as {
-                context: Array<{
-                  page_content: string;
-                  metadata: Record<string, any>;
-                }>;
-              })
-            : null;
+          const contextData = parseContextData(contextPart);
 
           const citations: Citation[] =
             contextData?.context.map((citation, index) => ({
@@ -160,17 +167,10 @@ export default function ChatPage({ params }: { params: { id: string } }) {
         return message;
       }
 
-      const [base64Part, responseText] =
+      const [contextPart, responseText] =
         message.content.split("__LLM_RESPONSE__");
 
-      const contextData = base64Part
-        ? (JSON.parse(atob(base64Part.trim())) as {
-            context: Array<{
-              page_content: string;
-              metadata: Record<string, any>;
-            }>;
-          })
-        : null;
+      const contextData = parseContextData(contextPart);
 
       const citations: Citation[] =
         contextData?.context.map((citation, index) => ({
@@ -204,23 +204,30 @@ export default function ChatPage({ params }: { params: { id: string } }) {
 
       try {
         if (!message.content.includes("__LLM_RESPONSE__")) {
+          // Streamed context arrives as a message annotation frame
+          const contextData = message.annotations?.find(
+            (annotation) =>
+              !!annotation &&
+              typeof annotation === "object" &&
+              "context" in annotation
+          ) as ContextData | undefined;
+
           return {
             ...message,
             content: markdownParse(message.content),
+            citations:
+              contextData?.context.map((citation, index) => ({
+                id: index + 1,
+                text: citation.page_content,
+                metadata: citation.metadata,
+              })) || [],
           };
         }
 
-        const [base64Part, responseText] =
+        const [contextPart, responseText] =
           message.content.split("__LLM_RESPONSE__");
 
-        const contextData = base64Part
-          ? (JSON.parse(atob(base64Part.trim())) as {
-              context: Array<{
-                page_content: string;
-                metadata: Record<string, any>;
-              }>;
-            })
-          : null;
+        const contextData = parseContextData(contextPart);
 
         const citations: Citation[] =
           contextData?.context.map((citation, index) => ({
@@ -5,15 +5,17 @@ Setup configuration for Fortes Education with OpenAI API key
 
 import os
 
-# Set environment variables
-os.environ['OPENAI_API_KEY'] = 'your-openai-api-key-here'
-os.environ['OPENAI_API_BASE'] = 'https://api.openai.com/v1'
-os.environ['EMBEDDING_MODEL'] = 'text-embedding-3-small'
-os.environ['GENERATION_MODEL'] = 'gpt-4o-mini'
-os.environ['RAG_STORE'] = 'sqlite'
-os.environ['SQLITE_FILE'] = './fortes.db'
-os.environ['PROJECT_NAME'] = 'Fortes Education'
-os.environ['VERSION'] = '1.0.0'
+# Set environment variables in one update; app settings also read .env
+os.environ.update({
+    'OPENAI_API_KEY': 'your-openai-api-key-here',
+    'OPENAI_API_BASE': 'https://api.openai.com/v1',
+    'EMBEDDING_MODEL': 'text-embedding-3-small',
+    'GENERATION_MODEL': 'gpt-4o-mini',
+    'RAG_STORE': 'sqlite',
+    'SQLITE_FILE': './fortes.db',
+    'PROJECT_NAME': 'Fortes Education',
+    'VERSION': '1.0.0',
+})
 
 print("✓ OpenAI API key configured")
 print("✓ Using SQLite database")